@@ -1,23 +1,87 @@
+import asyncio
 import os
-import json
+import threading
+import time
 import logging
-import re
-from datetime import datetime, timedelta
-from fastapi import FastAPI, HTTPException, status
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import uvicorn
-from typing import Optional
+from typing import Annotated, List, Literal, Optional, Tuple
 
-from models.prediction import StockPredictor
+from models import ensemble
+from models.prediction import HAS_PROPHET, MAX_FORECAST_DAYS, StockPredictor, load_prophet, prophet_loaded
 from models.sentiment import SentimentAnalyzer
-from utils.backtest import run_backtest
+from utils.backtest import STRATEGIES, run_backtest, run_backtest_grid, run_backtests
+from utils.cache import AnalysisCache, dumps, ttl_for
+from utils.live import LiveHub, Subscriber
+from utils.market_data import market_data
+from utils.portfolio import portfolio_analytics
+from utils import metrics
+from utils.scheduler import PopularityTracker, PrecomputeScheduler
+from utils.singleflight import SingleFlight
+from utils.workers import PoolSaturated, pools
+from utils import wire
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    maintenance_task = asyncio.create_task(_maintain_cache_periodically())
+    if PRELOAD_MODELS == "startup":
+        threading.Thread(target=preload_models, name="model-preload", daemon=True).start()
+    if PRECOMPUTE_IN_APP:
+        precompute_scheduler.start()
+    yield
+    live_hub.close()
+    precompute_scheduler.stop()
+    maintenance_task.cancel()
+    # Graceful shutdown: finish in-flight fits/fetches, drop queued ones
+    pools.shutdown(wait=True)
+
+async def _maintain_cache_periodically():
+    while True:
+        try:
+            removed = await asyncio.to_thread(analysis_cache.evict)
+            if removed:
+                logger.info(f"Evicted {removed} cache files.")
+        except Exception as e:
+            logger.error(f"Cache eviction failed: {e}")
+        # Shared with a standalone precompute worker, if one runs
+        await asyncio.to_thread(popularity.save)
+        await asyncio.sleep(CACHE_EVICTION_INTERVAL)
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request: Request, exc: PoolSaturated):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": f"Server busy ({exc.stage}), please retry."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+# Opt-in Server-Timing header with per-stage durations, for profiling from the browser
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+requests_in_flight = 0
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    global requests_in_flight
+    timings = metrics.start_request_timing()
+    started = time.perf_counter()
+    requests_in_flight += 1
+    try:
+        response = await call_next(request)
+    finally:
+        requests_in_flight -= 1
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings, time.perf_counter() - started)
+    return response
 
 # CORS configuration
 app.add_middleware(
@@ -28,16 +92,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Cache directory
-CACHE_DIR = "cache"
-os.makedirs(CACHE_DIR, exist_ok=True)
-CACHE_DIR_REAL_PATH = os.path.realpath(CACHE_DIR)
+# Cache directory: in-memory LRU in front of atomically written JSON files
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+analysis_cache = AnalysisCache(
+    CACHE_DIR,
+    max_memory_entries=int(os.getenv("CACHE_MEMORY_ENTRIES", "256")),
+    max_memory_bytes=int(os.getenv("CACHE_MEMORY_MB", "64")) * 2**20,
+    max_disk_bytes=int(os.getenv("CACHE_DISK_MB", "256")) * 2**20,
+    max_disk_age_hours=float(os.getenv("CACHE_DISK_MAX_AGE_HOURS", "72")),
+    # gzip level for cache files; 0 writes plain JSON
+    compress_level=int(os.getenv("CACHE_COMPRESS_LEVEL", "1")),
+)
+CACHE_EVICTION_INTERVAL = int(os.getenv("CACHE_EVICTION_INTERVAL", "600"))
+
+# Serve expired entries while one background refresh recomputes them
+STALE_WHILE_REVALIDATE = os.getenv("STALE_WHILE_REVALIDATE", "false").lower() in ("1", "true", "yes")
+STALE_MAX_HOURS = float(os.getenv("STALE_MAX_HOURS", "24"))
 
-try:
-    stock_predictor_instance = StockPredictor() # Renamed to avoid conflict with local 'predictor'
-except Exception as e:
-    logger.error(f"Failed to load stock predictor: {e}")
-    stock_predictor_instance = None
+# How long a forecast waits on Prophet once the cheap ensemble members are ready
+FORECAST_PROPHET_WAIT = float(os.getenv("FORECAST_PROPHET_WAIT", "3"))
+
+# Live updates: how often each watched symbol is re-checked, and per-connection limits
+LIVE_POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", "60"))
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+LIVE_MAX_SYMBOLS = int(os.getenv("LIVE_MAX_SYMBOLS", "50"))
+LIVE_RECENT_BARS = 5
+
+# Coalesces concurrent cache misses for the same (symbol, category)
+inflight = SingleFlight()
+
+# Request counts per symbol, used to order background refreshes
+popularity = PopularityTracker(os.path.join(CACHE_DIR, "popularity.stats"))
+PRECOMPUTE_IN_APP = os.getenv("PRECOMPUTE_IN_APP", "true").lower() in ("1", "true", "yes")
 
 try:
     sentiment_analyzer = SentimentAnalyzer()
@@ -45,91 +131,189 @@ except Exception as e:
     logger.error(f"Failed to load sentiment analyzer: {e}")
     sentiment_analyzer = None
 
+# Prophet and FinBERT load on first use by default ("lazy"). "startup" loads them
+# in the background once the server is up, with /ready answering 503 until done;
+# "import" loads them while this module is imported, so a pre-forking server
+# (gunicorn with preload_app, see gunicorn.conf.py) shares them copy-on-write.
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "lazy").lower()
+models_ready = threading.Event()
+
+def preload_models():
+    started = time.perf_counter()
+    if HAS_PROPHET:
+        try:
+            # Fits run in worker processes; forked workers inherit the imported modules
+            load_prophet()
+        except Exception as e:
+            logger.error(f"Failed to load Prophet: {e}")
+    if sentiment_analyzer:
+        sentiment_analyzer.load()
+    logger.info(f"Models preloaded in {time.perf_counter() - started:.1f}s")
+    models_ready.set()
+
+def _model_status():
+    def state(available, loaded):
+        return "loaded" if loaded else "on_demand" if available else "unavailable"
+    return {
+        "prophet": state(HAS_PROPHET, prophet_loaded()),
+        "finbert": state(bool(sentiment_analyzer and sentiment_analyzer.enabled), bool(sentiment_analyzer and sentiment_analyzer.loaded)),
+    }
+
+if PRELOAD_MODELS == "import":
+    preload_models()
+elif PRELOAD_MODELS != "startup":
+    models_ready.set()
+
 class AnalysisRequest(BaseModel):
     symbol: str
 
-def _sanitize_filename_part(part: str) -> str:
-    """Sanitizes a string to be used as part of a filename."""
-    return re.sub(r'[^\w.-]', '', part).strip()
+class BatchAnalysisRequest(BaseModel):
+    symbols: List[str] = Field(..., min_length=1, max_length=200)
+    days: int = Field(30, ge=1, le=MAX_FORECAST_DAYS)
+    fields: Optional[List[str]] = None
+    points: Optional[int] = Field(None, ge=16, le=5000)
+    format: Literal["json", "compact"] = "json"
+
+class BacktestGridRequest(BaseModel):
+    symbols: List[str] = Field(..., min_length=1, max_length=1000)
+    # (fast, slow) window sizes in bars
+    windows: List[Tuple[Annotated[int, Field(ge=1)], Annotated[int, Field(ge=1)]]] = Field(default=[(20, 50)], min_length=1, max_length=500)
+    strategy: str = "sma_crossover"
+    include_history: bool = False
+
+class PortfolioRequest(BaseModel):
+    holdings: List[str] = Field(..., min_length=1, max_length=1000)
+    # Relative weights, normalized server-side; equal weights when omitted
+    weights: Optional[List[float]] = None
+    benchmark: str = "SPY"
+    period: str = "1y"
+    confidence: float = Field(0.95, gt=0.5, lt=1)
+    include_matrices: bool = True
 
-def _get_safe_cache_path(symbol: str, category: str) -> Optional[str]:
+def get_cached_analysis(symbol: str, category: str, hours: Optional[float] = None):
+    return analysis_cache.get(symbol, category, hours)
+
+def save_cached_analysis(symbol: str, category: str, data: dict):
+    analysis_cache.save(symbol, category, data)
+
+async def cached_or_compute(symbol: str, category: str, compute):
     """
-    Constructs a safe cache file path and verifies it's within CACHE_DIR.
-    Returns None if the path is unsafe.
+    Serves `symbol`/`category` from cache (fresh within the category TTL), otherwise runs `compute` once for all
+    concurrent callers. With STALE_WHILE_REVALIDATE enabled, an expired entry
+    (up to STALE_MAX_HOURS old) is returned immediately while a single
+    background refresh recomputes it.
     """
-    sanitized_symbol = _sanitize_filename_part(symbol)
-    sanitized_category = _sanitize_filename_part(category)
-    
-    if not sanitized_symbol or not sanitized_category:
-        logger.error(f"Sanitized symbol or category is empty: symbol='{symbol}', category='{category}'")
-        return None
+    hours = ttl_for(category)
+    data, age = analysis_cache.load(symbol, category, hours)
+    if data is not None and age < hours * 3600:
+        return data
 
-    filename = f"{sanitized_symbol}_{sanitized_category}.json"
-    prospective_path = os.path.join(CACHE_DIR, filename)
-    
-    # Resolve the real path to prevent directory traversal
-    resolved_path = os.path.realpath(prospective_path)
+    key = (symbol, category)
+    if data is not None and STALE_WHILE_REVALIDATE and age < STALE_MAX_HOURS * 3600:
+        logger.info(f"Serving stale {symbol}_{category} while refreshing.")
+        inflight.refresh(key, _compute_and_save, symbol, category, compute)
+        return data
 
-    # Ensure the resolved path is actually inside our intended cache directory
-    if not resolved_path.startswith(CACHE_DIR_REAL_PATH):
-        logger.error(f"Attempted path traversal detected: {prospective_path} resolved to {resolved_path}")
-        return None
-    
-    return prospective_path
+    return await inflight.do(key, _compute_and_save, symbol, category, compute)
 
+async def _compute_and_save(symbol: str, category: str, compute):
+    result = await compute()
+    if result:
+        save_cached_analysis(symbol, category, result)
+    return result
 
-def get_cached_analysis(symbol: str, category: str, hours: int = 12):
-    cache_path = _get_safe_cache_path(symbol, category)
-    if not cache_path:
+def _fit_outcome(symbol: str, task):
+    try:
+        return task.result()
+    except Exception as e:
+        metrics.record_error("fit")
+        logger.error(f"Prophet forecast failed for {symbol}: {e}")
+        return {}
+
+async def _compute_forecast(symbol: str):
+    """
+    Fits the cheap ensemble members on a thread while Prophet runs in the
+    process pool. If Prophet is still running FORECAST_PROPHET_WAIT seconds
+    after the cheap models are done, or the fit stage had no room for it,
+    their ensemble is returned (marked partial) and Prophet finishes in the
+    background, replacing the cached forecast when it does.
+    """
+    predictor = StockPredictor(symbol)
+    data = await pools.run("fetch", predictor.fetch_data, "2y")
+    if data.empty:
+        metrics.record_error("fit")
         return None
-    
-    if os.path.exists(cache_path):
+
+    prophet = None
+    if HAS_PROPHET and "prophet" in ensemble.FORECAST_MODELS:
+        prophet = asyncio.ensure_future(pools.run("fit", ensemble.fit_prophet, symbol, data, MAX_FORECAST_DAYS))
+    results = {}
+    # Timed here: the fits themselves run in worker processes, outside this process's metrics
+    with metrics.span("fit"):
         try:
-            file_mod_time = os.path.getmtime(cache_path)
-            if (datetime.now().timestamp() - file_mod_time) < (hours * 3600):
-                with open(cache_path, 'r') as f:
-                    return json.load(f)
-            else:
-                logger.info(f"Cache for {symbol}_{category} expired.")
-        except FileNotFoundError:
-            logger.warning(f"Cache file '{cache_path}' disappeared unexpectedly.")
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decoding JSON from cache file '{cache_path}': {e}")
-        except IOError as e:
-            logger.error(f"I/O error reading cache file '{cache_path}': {e}")
+            results.update(await pools.run("ensemble", ensemble.fit_cheap_models, data, MAX_FORECAST_DAYS))
+        except PoolSaturated:
+            if prophet is not None:
+                prophet.cancel()
+                # Collect its outcome; it may have been rejected already
+                await asyncio.gather(prophet, return_exceptions=True)
+            raise
         except Exception as e:
-            logger.error(f"An unexpected error occurred while reading cache '{cache_path}': {e}")
-    return None
+            metrics.record_error("fit")
+            logger.error(f"Cheap forecast models failed for {symbol}: {e}")
+        if prophet is not None:
+            await asyncio.wait({prophet}, timeout=FORECAST_PROPHET_WAIT if results else None)
+    rejected = prophet is not None and prophet.done() and isinstance(prophet.exception(), PoolSaturated)
+    if rejected and not results:
+        raise prophet.exception()
+    partial = prophet is not None and (rejected or not prophet.done())
+    if partial:
+        inflight.refresh((symbol, "forecast-prophet"), _finish_prophet, symbol, data, dict(results), None if rejected else prophet)
+    elif prophet is not None:
+        results.update(_fit_outcome(symbol, prophet))
 
-def save_cached_analysis(symbol: str, category: str, data: dict):
-    cache_path = _get_safe_cache_path(symbol, category)
-    if not cache_path:
-        logger.warning(f"Failed to get safe cache path for saving: symbol='{symbol}', category='{category}'")
+    if not results:
+        metrics.record_error("fit")
+        return None
+    return ensemble.combine(symbol, data, MAX_FORECAST_DAYS, results, partial=partial)
+
+async def _finish_prophet(symbol: str, data, results: dict, prophet=None):
+    if prophet is None:
+        # The fit stage was full; wait for room rather than dropping Prophet from this forecast
+        prophet = asyncio.ensure_future(pools.run_queued("fit", ensemble.fit_prophet, symbol, data, MAX_FORECAST_DAYS))
+    await asyncio.wait({prophet})
+    prophet_results = _fit_outcome(symbol, prophet)
+    if not prophet_results:
         return
-    
-    try:
-        with open(cache_path, 'w') as f:
-            json.dump(data, f)
-    except IOError as e:
-        logger.error(f"I/O error writing to cache file '{cache_path}': {e}")
-    except Exception as e:
-        logger.error(f"An unexpected error occurred while saving cache '{cache_path}': {e}")
+    forecast = ensemble.combine(symbol, data, MAX_FORECAST_DAYS, {**results, **prophet_results})
+    save_cached_analysis(symbol, "forecast", forecast)
+    # A full analysis built meanwhile carries the partial forecast
+    analysis, _ = analysis_cache.load(symbol, "analysis")
+    if analysis is not None and (analysis.get("forecast") or {}).get("partial"):
+        save_cached_analysis(symbol, "analysis", {**analysis, "forecast": forecast})
+
+async def _get_forecast(symbol: str):
+    # One fit per symbol and data version, forecast out to MAX_FORECAST_DAYS;
+    # every `days` value is answered by slicing it with StockPredictor.summarize
+    return await cached_or_compute(symbol, "forecast", lambda: _compute_forecast(symbol))
+
+async def _compute_sentiment(symbol: str):
+    sentiment = await pools.run("sentiment", sentiment_analyzer.get_sentiment, symbol)
+    if "error" in sentiment:
+        raise HTTPException(status_code=500, detail=sentiment["error"])
+    return sentiment
+
+async def _compute_backtest(symbol: str):
+    return await pools.run("backtest", run_backtest, symbol)
 
 @app.get("/predict/{symbol}")
-async def get_prediction(symbol: str, days: int = 30):
-    if not stock_predictor_instance:
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Stock predictor model not loaded.")
-
-    cached = get_cached_analysis(symbol, f"prediction_{days}", 1)
-    if cached:
-        return cached
-        
-    predictor = StockPredictor(symbol)
-    if predictor.train(epochs=5):
-        prediction = predictor.predict(days=days)
-        if prediction:
-            save_cached_analysis(symbol, f"prediction_{days}", prediction)
-            return prediction
+async def get_prediction(symbol: str, days: int = Query(30, ge=1, le=MAX_FORECAST_DAYS)):
+    popularity.hit(symbol)
+    forecast = await _get_forecast(symbol)
+    with metrics.span("predict"):
+        prediction = StockPredictor.summarize(forecast, days)
+    if prediction:
+        return prediction
     raise HTTPException(status_code=404, detail="Prediction failed")
 
 @app.get("/sentiment/{symbol}")
@@ -137,92 +321,472 @@ async def get_sentiment(symbol: str):
     if sentiment_analyzer is None:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Sentiment analyzer model not loaded.")
 
-    cached = get_cached_analysis(symbol, "sentiment", 6)
-    if cached:
-        return cached
-
-    sentiment = sentiment_analyzer.get_sentiment(symbol)
-    if "error" in sentiment:
-        raise HTTPException(status_code=500, detail=sentiment["error"])
-    
-    save_cached_analysis(symbol, "sentiment", sentiment)
-    return sentiment
+    popularity.hit(symbol)
+    return await cached_or_compute(symbol, "sentiment", lambda: _compute_sentiment(symbol))
 
 @app.get("/backtest/{symbol}")
 async def get_backtest(symbol: str):
-    cached = get_cached_analysis(symbol, "backtest", 24)
-    if cached:
-        return cached
-
-    results = run_backtest(symbol)
+    popularity.hit(symbol)
+    results = await cached_or_compute(symbol, "backtest", lambda: _compute_backtest(symbol))
     if results:
-        save_cached_analysis(symbol, "backtest", results)
         return results
     raise HTTPException(status_code=404, detail="Backtest failed")
 
-@app.get("/full-analysis/{symbol}")
-async def get_full_analysis(symbol: str, days: int = 30):
+@app.get("/indicators/{symbol}")
+async def get_indicators(symbol: str, price: Optional[float] = Query(None, gt=0)):
+    """
+    Latest SMA/EMA/RSI/Bollinger/drawdown values and market regime. With
+    `price`, they are evaluated for a live price of the session in progress
+    without reprocessing the history.
+    """
+    popularity.hit(symbol)
+    # Brings the stored bars (and the indicators kept with them) up to date
+    await pools.run("fetch", market_data.get_history, symbol, "1y")
+    result = market_data.tick(symbol, price) if price is not None else market_data.indicators(symbol)
+    if result:
+        return result
+    raise HTTPException(status_code=404, detail="No price history")
+
+@app.post("/backtest/grid")
+async def backtest_grid(request: BacktestGridRequest):
+    """Sweeps every symbol x parameter set in one vectorized pass."""
+    if request.strategy not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy: {request.strategy}")
+    results = await pools.run(
+        "backtest", run_backtest_grid, request.symbols, request.windows,
+        strategy=request.strategy, include_history=request.include_history,
+    )
+    # Up to symbols x windows results: serialize them off the generic encoder, which would block the loop
+    return Response(await asyncio.to_thread(dumps, results), media_type="application/json")
+
+@app.post("/portfolio/analytics")
+async def get_portfolio_analytics(request: PortfolioRequest):
+    """
+    Correlation/covariance, betas, volatility, VaR/CVaR and drawdowns for a
+    weighted set of holdings, computed in one pass over the stored prices.
+    """
+    if len(set(request.holdings)) != len(request.holdings):
+        raise HTTPException(status_code=400, detail="Holdings must be unique")
+    if request.weights is not None:
+        if len(request.weights) != len(request.holdings):
+            raise HTTPException(status_code=400, detail="weights must have one entry per holding")
+        if any(w < 0 for w in request.weights) or sum(request.weights) <= 0:
+            raise HTTPException(status_code=400, detail="weights must be non-negative with a positive sum")
     try:
-        # Check for full analysis cache (shorter TTL as it combines everything)
-        cached = get_cached_analysis(symbol, f"full_{days}", 1)
-        if cached:
-            return cached
-
-        predictor = StockPredictor(symbol)
-        # train() now handles its own model persistence
-        predictor.train(epochs=5)
-        prediction = predictor.predict(days=days)
-        
-        sentiment = sentiment_analyzer.get_sentiment(symbol) if sentiment_analyzer else {"sentiment": "Neutral", "score": 0.0, "count": 0, "status": "Model Offline"}
-        backtest = run_backtest(symbol)
-        
-        # Get historical data for the frontend fallback
-        history_data = predictor.fetch_data(period="1y")
-        if not history_data.empty:
-            history = {
-                "timestamps": (history_data.index.astype(int) // 10**9).tolist(),
-                "open": history_data['Open'].values.flatten().tolist() if 'Open' in history_data.columns else history_data['Close'].values.flatten().tolist(),
-                "close": history_data['Close'].values.flatten().tolist(),
-                "high": history_data['High'].values.flatten().tolist(),
-                "low": history_data['Low'].values.flatten().tolist(),
-                "volume": history_data['Volume'].values.flatten().tolist(),
-            }
-        else:
-            history = {
-                "timestamps": [],
-                "close": [],
-                "high": [],
-                "low": [],
-                "volume": [],
-            }
+        result = await pools.run(
+            "backtest", portfolio_analytics, request.holdings, request.weights,
+            benchmark=request.benchmark, period=request.period,
+            confidence=request.confidence, include_matrices=request.include_matrices,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result:
+        # Matrices for hundreds of holdings are large; skip the generic encoder
+        return Response(dumps(result), media_type="application/json")
+    raise HTTPException(status_code=404, detail="No price history for any holding")
 
-        # Get SPY history for correlation fallback
-        spy_predictor = StockPredictor("SPY")
-        spy_history_data = spy_predictor.fetch_data(period="1y")
-        if not spy_history_data.empty:
-            spy_history = {
-                "timestamps": (spy_history_data.index.astype(int) // 10**9).tolist(),
-                "close": spy_history_data['Close'].values.flatten().tolist(),
-            }
-        else:
-            spy_history = {
-                "timestamps": [],
-                "close": [],
-            }
-        
-        result = {
-            "prediction": prediction,
-            "sentiment": sentiment,
-            "backtest": backtest,
-            "history": history,
-            "spy_history": spy_history
+async def _compute_full_analysis(symbol: str):
+    predictor = StockPredictor(symbol)
+
+    # Fit in a worker process while news/inference and the backtest run on threads
+    forecast_task = _get_forecast(symbol)
+    if sentiment_analyzer:
+        sentiment_task = cached_or_compute(symbol, "sentiment", lambda: _compute_sentiment(symbol))
+    else:
+        sentiment_task = asyncio.sleep(0, {"sentiment": "Neutral", "score": 0.0, "count": 0, "status": "Model Offline"})
+    backtest_task = cached_or_compute(symbol, "backtest", lambda: _compute_backtest(symbol))
+    forecast, sentiment, backtest = await asyncio.gather(forecast_task, sentiment_task, backtest_task)
+    
+    # Get historical data for the frontend fallback
+    history_data = await pools.run("fetch", predictor.fetch_data, "1y")
+    if not history_data.empty:
+        history = {
+            "timestamps": (history_data.index.astype(int) // 10**9).tolist(),
+            "open": history_data['Open'].values.flatten().tolist() if 'Open' in history_data.columns else history_data['Close'].values.flatten().tolist(),
+            "close": history_data['Close'].values.flatten().tolist(),
+            "high": history_data['High'].values.flatten().tolist(),
+            "low": history_data['Low'].values.flatten().tolist(),
+            "volume": history_data['Volume'].values.flatten().tolist(),
         }
-        
-        save_cached_analysis(symbol, f"full_{days}", result)
-        return result
+    else:
+        history = {
+            "timestamps": [],
+            "close": [],
+            "high": [],
+            "low": [],
+            "volume": [],
+        }
+
+    # Get SPY history for correlation fallback (shared across symbols by the store)
+    spy_history_data = await pools.run("fetch", market_data.get_history, "SPY", period="1y")
+    if not spy_history_data.empty:
+        spy_history = {
+            "timestamps": (spy_history_data.index.astype(int) // 10**9).tolist(),
+            "close": spy_history_data['Close'].values.flatten().tolist(),
+        }
+    else:
+        spy_history = {
+            "timestamps": [],
+            "close": [],
+        }
+    
+    # The full forecast is cached; the per-`days` prediction is sliced on the way out
+    return {
+        "forecast": forecast,
+        "sentiment": sentiment,
+        "backtest": backtest,
+        "history": history,
+        "spy_history": spy_history
+    }
+
+FULL_ANALYSIS_FIELDS = ("prediction", "sentiment", "backtest", "history", "spy_history")
+
+# Parallel columns in a full-analysis response: (path, x column, column whose shape LTTB preserves)
+FULL_ANALYSIS_SERIES = [
+    (("prediction", "forecast"), "ds", "yhat"),
+    (("backtest", "history"), "dates", "strategy_returns"),
+    (("history",), "timestamps", "close"),
+    (("spy_history",), "timestamps", "close"),
+]
+
+def _parse_fields(fields: Optional[List[str]]):
+    if not fields:
+        return None
+    fields = [f.strip() for field in fields for f in field.split(",") if f.strip()]
+    unknown = sorted(set(fields) - set(FULL_ANALYSIS_FIELDS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)} (expected {', '.join(FULL_ANALYSIS_FIELDS)})")
+    return set(fields)
+
+def _full_analysis_response(analysis: dict, days: int, fields=None, points=None, compact=False):
+    """
+    Builds the response from a cached analysis without modifying it: only
+    `fields` (default all), series downsampled to `points` and, in compact
+    mode, encoded with utils.wire.
+    """
+    response = {}
+    if not fields or "prediction" in fields:
+        with metrics.span("predict"):
+            response["prediction"] = StockPredictor.summarize(analysis["forecast"], days)
+    response.update({key: analysis[key] for key in FULL_ANALYSIS_FIELDS[1:] if not fields or key in fields})
+    if points or compact:
+        with metrics.span("encode"):
+            response = wire.reshape_series(response, FULL_ANALYSIS_SERIES, points=points, compact=compact)
+    return response
+
+def _compact_response(payload: dict, request: Request):
+    raw = dumps(payload)
+    with metrics.span("compress"):
+        body, encoding = wire.compress(raw, request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=wire.COMPACT_MEDIA_TYPE, headers=headers)
+
+@app.get("/full-analysis/{symbol}")
+async def get_full_analysis(
+    request: Request,
+    symbol: str,
+    days: int = Query(30, ge=1, le=MAX_FORECAST_DAYS),
+    fields: Optional[List[str]] = Query(None, description="Top-level fields to return (repeated or comma-separated); default all"),
+    points: Optional[int] = Query(None, ge=16, le=5000, description="Downsample every series to at most this many points (LTTB)"),
+    format: Literal["json", "compact"] = Query("json", description="'compact' encodes series per utils/wire.py and compresses the body"),
+):
+    fields = _parse_fields(fields)
+    popularity.hit(symbol)
+    try:
+        analysis = await cached_or_compute(symbol, "analysis", lambda: _compute_full_analysis(symbol))
+        response = _full_analysis_response(analysis, days, fields, points, compact=format == "compact")
+        return _compact_response(response, request) if format == "compact" else response
+    except (PoolSaturated, HTTPException):
+        raise
     except Exception as e:
         print(f"Full analysis error for {symbol}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _missing(symbols, category):
+    return [s for s in symbols if get_cached_analysis(s, category) is None]
+
+def _prime_sentiment(symbols):
+    # One news gather + one deduplicated FinBERT pass for the whole batch
+    for symbol, sentiment in sentiment_analyzer.get_sentiment_many(symbols).items():
+        save_cached_analysis(symbol, "sentiment", sentiment)
+
+def _prime_backtests(symbols):
+    # One vectorized backtest over the whole batch, shaped like /backtest/{symbol}
+    for symbol, result in run_backtests(symbols).items():
+        save_cached_analysis(symbol, "backtest", result)
+
+async def _stream_batch_analysis(symbols, days, fields=None, points=None, compact=False):
+    # Shared inputs first: one multi-ticker download (SPY included), then batched
+    # sentiment and backtests while the forecasts fit; each analysis only assembles them
+    await pools.run("fetch", market_data.prefetch, symbols + ["SPY"])
+
+    # At most one forecast per fit worker, so a long watchlist waits its turn
+    # instead of overfilling the stage and failing with PoolSaturated
+    fit_slots = asyncio.Semaphore(pools.stages["fit"].limit)
+
+    async def forecast(symbol):
+        async with fit_slots:
+            return await _get_forecast(symbol)
+
+    forecasts = {s: asyncio.ensure_future(forecast(s)) for s in _missing(symbols, "analysis")}
+
+    async def prime():
+        priming = [pools.run("backtest", _prime_backtests, _missing(symbols, "backtest"))]
+        if sentiment_analyzer:
+            priming.append(pools.run("sentiment", _prime_sentiment, _missing(symbols, "sentiment")))
+        for outcome in await asyncio.gather(*priming, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                logger.error(f"Batch priming failed: {outcome}")
+
+    primed = asyncio.ensure_future(prime())
+
+    async def analyze(symbol):
+        try:
+            # Symbols with a cached analysis are sent without waiting for the priming
+            if symbol in forecasts:
+                await forecasts[symbol]
+                await asyncio.shield(primed)
+            analysis = await cached_or_compute(symbol, "analysis", lambda: _compute_full_analysis(symbol))
+            return {"symbol": symbol, **_full_analysis_response(analysis, days, fields, points, compact)}
+        except HTTPException as e:
+            return {"symbol": symbol, "error": e.detail}
+        except Exception as e:
+            return {"symbol": symbol, "error": str(e)}
+
+    # Lines are sent as each symbol finishes
+    try:
+        for next_done in asyncio.as_completed([analyze(s) for s in symbols]):
+            yield dumps(await next_done) + b"\n"
+    finally:
+        # Client gone: stop waiting for fit slots (started fits finish for the cache)
+        for task in forecasts.values():
+            task.cancel()
+
+@app.post("/batch/full-analysis")
+async def batch_full_analysis(request: BatchAnalysisRequest):
+    """Streams one NDJSON line per symbol, in completion order."""
+    symbols = list(dict.fromkeys(request.symbols))
+    fields = _parse_fields(request.fields)
+    popularity.hit(*symbols)
+    # Lines stay uncompressed so each one reaches the client as soon as it is ready
+    stream = _stream_batch_analysis(symbols, request.days, fields, request.points, compact=request.format == "compact")
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+def _due(symbols, category, force):
+    """Symbols whose `category` entry is missing or expires before the next scheduler tick."""
+    if force:
+        return list(symbols)
+    horizon = ttl_for(category) * 3600 - precompute_scheduler.interval.total_seconds()
+    due = []
+    for symbol in symbols:
+        data, age = analysis_cache.load(symbol, category)
+        if data is None or age >= horizon:
+            due.append(symbol)
+    return due
+
+async def _refresh_entries(symbols, category, compute):
+    # Chunked to the stage limits so a refresh never fills the queues interactive requests use
+    chunk = max(1, pools.stages["fit"].limit)
+    for i in range(0, len(symbols), chunk):
+        outcomes = await asyncio.gather(
+            *[inflight.do((s, category), _compute_and_save, s, category, compute(s)) for s in symbols[i:i + chunk]],
+            return_exceptions=True,
+        )
+        for symbol, outcome in zip(symbols[i:i + chunk], outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Precompute of {symbol}_{category} failed: {outcome}")
+
+async def precompute(symbols, force=False):
+    """Refreshes forecasts, sentiment, backtests and full analyses for `symbols`, most popular first."""
+    await pools.run("fetch", market_data.prefetch, symbols + ["SPY"])
+
+    forecasts = _due(symbols, "forecast", force)
+    analyses = list(dict.fromkeys(forecasts + _due(symbols, "analysis", force)))
+    priming = [pools.run("backtest", _prime_backtests, _due(symbols, "backtest", force))]
+    if sentiment_analyzer:
+        priming.append(pools.run("sentiment", _prime_sentiment, _due(symbols, "sentiment", force)))
+    for outcome in await asyncio.gather(*priming, return_exceptions=True):
+        if isinstance(outcome, Exception):
+            logger.error(f"Precompute priming failed: {outcome}")
+
+    await _refresh_entries(forecasts, "forecast", lambda s: lambda: _compute_forecast(s))
+    await _refresh_entries(analyses, "analysis", lambda s: lambda: _compute_full_analysis(s))
+
+precompute_scheduler = PrecomputeScheduler(precompute, popularity)
+
+async def _live_state(symbol: str, horizons):
+    """
+    The small per-symbol state live subscribers are kept in sync with: recent
+    bars, indicators and regime, prediction summaries (without the forecast
+    series) and sentiment. Everything comes from the store and the caches
+    the HTTP endpoints share.
+    """
+    state = {}
+    data = await pools.run("fetch", market_data.get_history, symbol, "1mo")
+    if not data.empty:
+        state["bars"] = [
+            {"date": date.strftime('%Y-%m-%d'), **{column.lower(): float(row[column]) for column in data.columns}}
+            for date, row in data.tail(LIVE_RECENT_BARS).iterrows()
+        ]
+        indicators = market_data.indicators(symbol)
+        if indicators:
+            state["indicators"] = indicators
+            state["regime"] = indicators["regime"]
+
+    try:
+        forecast = await _get_forecast(symbol)
+        if forecast:
+            state["prediction"] = {
+                str(days): {k: v for k, v in StockPredictor.summarize(forecast, int(days)).items() if k != "forecast"}
+                for days in horizons
+            }
+    except Exception as e:
+        logger.error(f"Live prediction for {symbol} failed: {e}")
+
+    if sentiment_analyzer:
+        try:
+            state["sentiment"] = await cached_or_compute(symbol, "sentiment", lambda: _compute_sentiment(symbol))
+        except Exception as e:
+            logger.error(f"Live sentiment for {symbol} failed: {e}")
+    return state
+
+live_hub = LiveHub(_live_state, interval=LIVE_POLL_SECONDS)
+
+def _live_symbols(symbols):
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    return list(dict.fromkeys(s.strip() for symbol in symbols or [] for s in str(symbol).split(",") if s.strip()))
+
+def _live_days(days):
+    days = [int(d) for d in days or [30]]
+    if any(d < 1 or d > MAX_FORECAST_DAYS for d in days):
+        raise ValueError(f"days must be between 1 and {MAX_FORECAST_DAYS}")
+    return days
+
+@app.get("/live")
+async def live_events(
+    symbols: List[str] = Query(..., description="Symbols to follow (repeated or comma-separated)"),
+    days: List[int] = Query([30], description="Prediction horizons to receive"),
+):
+    """
+    Server-sent events for `symbols`: a "snapshot" per symbol, then "delta"
+    events carrying only what changed (new bars, prediction summaries,
+    sentiment, indicators, regime flips). One producer per symbol serves
+    every subscriber.
+    """
+    symbols = _live_symbols(symbols)
+    if not symbols or len(symbols) > LIVE_MAX_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"Follow between 1 and {LIVE_MAX_SYMBOLS} symbols")
+    try:
+        days = _live_days(days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    popularity.hit(*symbols)
+
+    async def stream():
+        subscriber = Subscriber(days)
+        live_hub.subscribe(subscriber, symbols)
+        try:
+            async for event in subscriber.events(heartbeat=LIVE_HEARTBEAT_SECONDS):
+                if event is None:
+                    yield b": keep-alive\n\n"
+                else:
+                    yield b"event: " + event["event"].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+        finally:
+            # Runs when the client disconnects and the response is cancelled
+            live_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/ws/live")
+async def live_socket(websocket: WebSocket):
+    """
+    WebSocket variant of /live. Clients send {"action": "subscribe" |
+    "unsubscribe", "symbols": [...]} (and optionally "days" with their first
+    subscribe) and receive the same snapshot/delta events as JSON messages.
+    """
+    await websocket.accept()
+    subscriber = None
+
+    async def send_events():
+        async for event in subscriber.events(heartbeat=LIVE_HEARTBEAT_SECONDS):
+            await websocket.send_text((dumps(event) if event else b'{"event": "heartbeat"}').decode())
+
+    sender = None
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+                action = message.get("action")
+                symbols = _live_symbols(message.get("symbols"))
+                if subscriber is None:
+                    subscriber = Subscriber(_live_days(message.get("days")))
+                    sender = asyncio.ensure_future(send_events())
+            except (ValueError, TypeError, AttributeError) as e:
+                await websocket.send_json({"event": "error", "detail": f"Invalid message: {e}"})
+                continue
+
+            if action == "subscribe":
+                if len(subscriber.symbols | set(symbols)) > LIVE_MAX_SYMBOLS:
+                    await websocket.send_json({"event": "error", "detail": f"At most {LIVE_MAX_SYMBOLS} symbols per connection"})
+                    continue
+                popularity.hit(*symbols)
+                live_hub.subscribe(subscriber, symbols)
+            elif action == "unsubscribe":
+                live_hub.unsubscribe(subscriber, symbols)
+            else:
+                await websocket.send_json({"event": "error", "detail": "action must be 'subscribe' or 'unsubscribe'"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if sender:
+            sender.cancel()
+        if subscriber:
+            live_hub.unsubscribe(subscriber)
+
+@app.get("/health")
+async def health():
+    """Liveness: answers as soon as the process serves requests; never loads models or calls upstreams."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 503 while configured model preloading is still running."""
+    body = {
+        "status": "ready" if models_ready.is_set() else "loading",
+        "preload": PRELOAD_MODELS,
+        "models": _model_status(),
+    }
+    if not models_ready.is_set():
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=body)
+    return body
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of stage latencies, cache and concurrency stats."""
+    cache_stats = analysis_cache.stats()
+    stage_stats = pools.stats()
+    lines = []
+    lines += metrics.sample_lines("stockz_cache_events_total", "Analysis cache lookups, writes and evictions since start.", [
+        ((("event", name),), cache_stats[name])
+        for name in ("memory_hits", "disk_hits", "misses", "expired", "writes", "memory_evictions", "disk_evictions", "errors")
+    ], kind="counter")
+    lines += metrics.sample_lines("stockz_cache_hit_ratio", "Fresh cache hits over all lookups.", [((), cache_stats["hit_ratio"])])
+    lines += metrics.sample_lines("stockz_cache_memory_bytes", "Bytes held by the in-memory cache tier.", [((), cache_stats["memory_bytes"])])
+    lines += metrics.sample_lines("stockz_stage_running", "Calls currently executing per worker stage.", [
+        ((("stage", name),), s["running"]) for name, s in stage_stats.items()
+    ])
+    lines += metrics.sample_lines("stockz_stage_pending", "Calls executing or queued per worker stage.", [
+        ((("stage", name),), s["pending"]) for name, s in stage_stats.items()
+    ])
+    lines += metrics.sample_lines("stockz_singleflight_in_flight", "Distinct computations currently coalescing callers.", [((), inflight.in_flight())])
+    lines += metrics.sample_lines("stockz_http_requests_in_flight", "HTTP requests currently being served.", [((), requests_in_flight)])
+    live_stats = live_hub.stats()
+    lines += metrics.sample_lines("stockz_live_symbols", "Symbols with a live update producer.", [((), live_stats["symbols"])])
+    lines += metrics.sample_lines("stockz_live_subscriptions", "Live (connection, symbol) subscriptions.", [((), live_stats["subscriptions"])])
+    return metrics.render(lines)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
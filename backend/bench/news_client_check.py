@@ -0,0 +1,159 @@
+"""
+Checks FinnhubNewsClient against a local stub of the Finnhub API.
+
+The stub replays scripted responses and records every request, so the checks
+see exactly what the client sent: a 429 with Retry-After is waited out and
+retried, 5xx retries stop at max_retries, other errors are not retried, calls
+are paced by the token bucket, and a refetch only asks for days since the
+previous fetch. Exits with code 1 if any check fails.
+
+    cd backend
+    python -m bench.news_client_check
+"""
+import datetime
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from utils.news_client import FinnhubNewsClient, NewsFetchError, TokenBucket
+
+
+class StubFinnhub:
+    """Serves queued (status, body, headers) responses; 200 with [] once the queue is empty."""
+
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                stub.requests.append({"path": url.path, "query": {k: v[0] for k, v in parse_qs(url.query).items()}, "at": time.monotonic()})
+                status, body, headers = stub.responses.pop(0) if stub.responses else (200, [], {})
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in {"Content-Type": "application/json", **headers}.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _item(id, days_ago=0, headline=None):
+    published = datetime.datetime.now() - datetime.timedelta(days=days_ago)
+    return {"id": id, "headline": headline or f"headline {id}", "datetime": int(published.timestamp())}
+
+
+def _client(stub, **kwargs):
+    return FinnhubNewsClient(api_key="test", base_url=stub.url, backoff=0.01, **kwargs)
+
+
+def check_retry_after(stub):
+    stub.reset((429, {"error": "limit"}, {"Retry-After": "1"}), (200, [_item(1)], {}))
+    started = time.monotonic()
+    items = _client(stub).company_news("AAPL")
+    waited = time.monotonic() - started
+    assert [i["id"] for i in items] == [1], items
+    assert len(stub.requests) == 2, stub.requests
+    # Retry-After is jittered by 0.5-1.5x
+    assert waited >= 0.5, f"retried after {waited:.2f}s despite Retry-After: 1"
+    return f"429 + Retry-After: 1 retried once after {waited:.2f}s"
+
+
+def check_retry_limits(stub):
+    stub.reset(*[(503, {}, {})] * 5)
+    try:
+        _client(stub, max_retries=2).company_news("AAPL")
+        raise AssertionError("expected NewsFetchError after repeated 503s")
+    except NewsFetchError as e:
+        assert e.status_code == 503, e.status_code
+    assert len(stub.requests) == 3, f"{len(stub.requests)} requests for max_retries=2"
+
+    stub.reset((403, {"error": "forbidden"}, {}))
+    try:
+        _client(stub).company_news("AAPL")
+        raise AssertionError("expected NewsFetchError on 403")
+    except NewsFetchError as e:
+        assert e.status_code == 403, e.status_code
+    assert len(stub.requests) == 1, "403 must not be retried"
+    return "503 retried max_retries times, 403 not retried"
+
+
+def check_rate_limit(stub):
+    stub.reset()
+    client = _client(stub, refresh_seconds=0)
+    client.bucket = TokenBucket(rate=20, capacity=1)
+    for i in range(6):
+        client.company_news(f"S{i}")
+    gaps = [b["at"] - a["at"] for a, b in zip(stub.requests, stub.requests[1:])]
+    # 20 calls/s with no burst: at least ~50 ms apart (allow a little timer slack)
+    assert min(gaps) >= 0.04, f"calls {min(gaps) * 1000:.0f} ms apart at 20/s"
+    return f"6 calls at 20/s, min gap {min(gaps) * 1000:.0f} ms"
+
+
+def check_incremental_window(stub):
+    today = datetime.date.today()
+    stub.reset((200, [_item(1, days_ago=3), _item(2, days_ago=0)], {}), (200, [_item(2, days_ago=0), _item(3, days_ago=0)], {}))
+    client = _client(stub, refresh_seconds=0)
+    first = client.company_news("AAPL", days=7)
+    second = client.company_news("AAPL", days=7)
+
+    queries = [r["query"] for r in stub.requests]
+    assert queries[0]["from"] == (today - datetime.timedelta(days=7)).isoformat(), queries[0]
+    # The refetch only covers the last fetched day (re-asked to catch late items)
+    assert queries[1]["from"] == today.isoformat(), queries[1]
+    assert [i["id"] for i in first] == [2, 1], first
+    assert sorted(i["id"] for i in second) == [1, 2, 3], second
+
+    # Within refresh_seconds, no request at all
+    stub.reset()
+    cached = _client(stub, refresh_seconds=300)
+    cached.company_news("MSFT")
+    cached.company_news("MSFT")
+    assert len(stub.requests) == 1, f"{len(stub.requests)} requests within refresh_seconds"
+    return f"refetch from={queries[1]['from']}, items merged without duplicates"
+
+
+CHECKS = [check_retry_after, check_retry_limits, check_rate_limit, check_incremental_window]
+
+
+def main():
+    stub = StubFinnhub()
+    failures = 0
+    try:
+        for check in CHECKS:
+            try:
+                print(f"  ok    {check.__name__}: {check(stub)}")
+            except Exception as e:
+                failures += 1
+                print(f"  FAIL  {check.__name__}: {e if isinstance(e, AssertionError) else repr(e)}")
+    finally:
+        stub.close()
+    if failures:
+        print(f"\nFAILED: {failures} of {len(CHECKS)} checks")
+        return 1
+    print("\nNews client OK.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Offline stand-ins for the network-facing pieces of the backend.
+
+Recorded closes in fixtures/ohlcv replace yf.download and canned payloads in
+fixtures/news.json replace Finnhub. Fixture bars are re-dated to end on the
+latest business day so the period slicing in the market-data store behaves
+as it would against live data.
+"""
+import json
+import os
+import socket
+import time
+
+import numpy as np
+import pandas as pd
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_closes():
+    closes = {}
+    ohlcv_dir = os.path.join(FIXTURES_DIR, "ohlcv")
+    for name in sorted(os.listdir(ohlcv_dir)):
+        if name.endswith(".csv"):
+            closes[name[:-4]] = pd.read_csv(os.path.join(ohlcv_dir, name))["Close"].to_numpy()
+    return closes
+
+
+def _frame(close, end):
+    index = pd.bdate_range(end=end, periods=len(close), name="Date")
+    # Only closes were recorded; derive a plausible intraday range and volume
+    return pd.DataFrame({
+        "Open": np.r_[close[0], close[:-1]],
+        "High": close * 1.005,
+        "Low": close * 0.995,
+        "Close": close,
+        "Volume": np.full(len(close), 1_000_000),
+    }, index=index)
+
+
+class OfflineMarket:
+    """Drop-in for yf.download over the recorded fixtures; SPY is an average of them."""
+
+    def __init__(self):
+        self.closes = load_closes()
+        self.closes["SPY"] = np.mean([c for c in self.closes.values()], axis=0)
+        self.end = pd.offsets.BDay().rollback(pd.Timestamp.now().normalize())
+        self.calls = 0
+
+    def history(self, symbol, start=None):
+        close = self.closes.get(symbol)
+        if close is None:
+            return pd.DataFrame()
+        frame = _frame(close, self.end)
+        return frame[frame.index >= pd.Timestamp(start)] if start else frame
+
+    def download(self, tickers, start=None, period=None, group_by=None, progress=False, **kwargs):
+        self.calls += 1
+        if isinstance(tickers, (list, tuple)):
+            frames = {t: self.history(t, start) for t in tickers}
+            frames = {t: f for t, f in frames.items() if not f.empty}
+            return pd.concat(frames, axis=1) if frames else pd.DataFrame()
+        return self.history(tickers, start)
+
+
+class CannedNews:
+    """
+    Replacement for FinnhubNewsClient._get serving fixtures/news.json; install
+    it with `FinnhubNewsClient._get = staticmethod(CannedNews())`.
+    """
+
+    def __init__(self):
+        with open(os.path.join(FIXTURES_DIR, "news.json")) as f:
+            self.payloads = json.load(f)
+        self.calls = 0
+
+    def __call__(self, path, params):
+        self.calls += 1
+        now = time.time()
+        return [
+            {"id": item["id"], "headline": item["headline"], "datetime": int(now - item["age_hours"] * 3600)}
+            for item in self.payloads.get(params["symbol"], [])
+        ]
+
+
+def deny_network():
+    """Makes any non-loopback connection fail so a benchmark cannot silently go online."""
+    original_connect = socket.socket.connect
+
+    def guarded_connect(sock, address):
+        host = address[0] if isinstance(address, tuple) else address
+        if isinstance(host, str) and host not in ("127.0.0.1", "::1", "localhost") and not host.startswith("/"):
+            raise ConnectionError(f"Network access blocked during benchmarks: {address}")
+        return original_connect(sock, address)
+
+    socket.socket.connect = guarded_connect
@@ -0,0 +1,245 @@
+"""
+Offline benchmark suite for the predictor, sentiment, backtest and API paths.
+
+Replays the recorded fixtures with network access blocked, reports p50/p95
+latency, throughput under concurrency and peak RSS, and compares p95s with a
+stored baseline; a regression beyond the tolerance exits non-zero.
+
+    cd backend
+    python -m bench.run                       # compare with bench/baseline.json
+    python -m bench.run --save-baseline       # record a new baseline on this machine
+    python -m bench.run --only backtest api   # run a subset
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+
+def _isolate(workdir):
+    # Must run before any backend module is imported: paths and flags are read at import time
+    os.environ["CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.environ["SAVED_MODELS_DIR"] = os.path.join(workdir, "saved_models")
+    os.environ["HEADLINE_CACHE_PATH"] = os.path.join(workdir, "headline_scores.db")
+    os.environ["PRECOMPUTE_IN_APP"] = "false"
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+
+def _summary(latencies, wall=None):
+    ordered = sorted(latencies)
+    result = {
+        "n": len(ordered),
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+    }
+    if wall:
+        result["throughput_rps"] = len(ordered) / wall
+    return result
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def bench_predictor(symbols, repeat):
+    from models.ensemble import fit_cheap_models
+    from models.prediction import MAX_FORECAST_DAYS, StockPredictor
+
+    cold, warm, cheap = [], [], []
+    for _ in range(repeat):
+        for symbol in symbols:
+            predictor = StockPredictor(symbol)
+            data = predictor.fetch_data("2y")
+            model_path = predictor._model_path()
+            if os.path.exists(model_path):
+                os.remove(model_path)
+            cold.append(_timed(predictor.forecast, data=data))
+            # Same data again: served from the persisted model without refitting
+            warm.append(_timed(predictor.forecast, data=data))
+            # Fit plus rolling-origin backtest of the non-Prophet ensemble members
+            cheap.append(_timed(fit_cheap_models, data, MAX_FORECAST_DAYS))
+    return {
+        "predictor_cold_fit": _summary(cold),
+        "predictor_saved_model": _summary(warm),
+        "ensemble_cheap_models": _summary(cheap),
+    }
+
+
+def bench_sentiment(symbols, repeat):
+    from models import sentiment
+
+    analyzer = sentiment.SentimentAnalyzer()
+    # Model load time is not part of the scoring benchmark
+    if not analyzer.load():
+        print("  sentiment: FinBERT not available offline, skipping")
+        return {}
+
+    cold, warm = [], []
+    for _ in range(repeat):
+        analyzer.scores = sentiment.HeadlineScoreStore(tempfile.mktemp(suffix=".db"))
+        analyzer.news.refresh_seconds = 0
+        cold.append(_timed(analyzer.get_sentiment_many, symbols))
+        warm.append(_timed(analyzer.get_sentiment_many, symbols))
+    # Backends are not comparable with each other, so non-default ones get their own baseline entries
+    suffix = "" if analyzer.backend_name == "torch" else f"_{analyzer.backend_name}"
+    return {f"sentiment_batch_cold{suffix}": _summary(cold), f"sentiment_batch_cached{suffix}": _summary(warm)}
+
+
+def bench_backtest(symbols, repeat):
+    from utils.backtest import run_backtest, run_backtest_grid
+
+    single = [_timed(run_backtest, s) for _ in range(repeat) for s in symbols]
+    windows = [(fast, slow) for fast in range(5, 55, 5) for slow in range(60, 260, 20)]
+    grid = [_timed(run_backtest_grid, symbols, windows) for _ in range(repeat)]
+    return {"backtest_single": _summary(single), f"backtest_grid_{len(windows)}x{len(symbols)}": _summary(grid)}
+
+
+async def _api(symbols, repeat, concurrency):
+    import httpx
+    import app as backend_app
+
+    transport = httpx.ASGITransport(app=backend_app.app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        async def timed_get(path):
+            started = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        cold = []
+        for _ in range(repeat):
+            shutil.rmtree(backend_app.analysis_cache.cache_dir, ignore_errors=True)
+            os.makedirs(backend_app.analysis_cache.cache_dir)
+            backend_app.analysis_cache._memory.clear()
+            backend_app.analysis_cache._memory_bytes = 0
+            cold.extend(await asyncio.gather(*[timed_get(f"/full-analysis/{s}?days=30") for s in symbols]))
+        results["api_full_analysis_miss"] = _summary(cold)
+
+        # Cache hits under concurrency, cycling through horizons that share one fit
+        paths = [f"/full-analysis/{s}?days={d}" for s in symbols for d in (1, 7, 30)] * max(1, repeat * 10)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(path):
+            async with semaphore:
+                return await timed_get(path)
+
+        started = time.perf_counter()
+        hits = await asyncio.gather(*[limited(p) for p in paths])
+        results[f"api_full_analysis_hit_c{concurrency}"] = _summary(hits, time.perf_counter() - started)
+    backend_app.pools.shutdown()
+    return results
+
+
+def bench_api(symbols, repeat, concurrency):
+    return asyncio.run(_api(symbols, repeat, concurrency))
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux; children covers the fit worker processes
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return {"self": own, "children": children}
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, current in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous:
+            continue
+        limit = previous["p95_ms"] * (1 + tolerance)
+        status = "REGRESSION" if current["p95_ms"] > limit else "ok"
+        print(f"  {name:<36} p95 {current['p95_ms']:9.1f} ms  baseline {previous['p95_ms']:9.1f} ms  {status}")
+        if status != "ok":
+            regressions.append(name)
+
+    previous_rss = baseline.get("peak_rss_mb", {}).get("self")
+    if previous_rss and results["peak_rss_mb"]["self"] > previous_rss * (1 + tolerance):
+        print(f"  peak RSS {results['peak_rss_mb']['self']:.0f} MB vs baseline {previous_rss:.0f} MB  REGRESSION")
+        regressions.append("peak_rss")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=["predictor", "sentiment", "backtest", "api"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--output", help="also write the results JSON here")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="stockz-bench-")
+    _isolate(workdir)
+
+    # Patch the network edges before the backend captures references to them
+    import yfinance
+    from bench.offline import CannedNews, OfflineMarket, deny_network
+    deny_network()
+    market = OfflineMarket()
+    yfinance.download = market.download
+    from utils.news_client import FinnhubNewsClient
+    FinnhubNewsClient._get = staticmethod(CannedNews())
+
+    symbols = [s for s in market.closes if s != "SPY"]
+    suites = args.only or ["predictor", "sentiment", "backtest", "api"]
+    results = {"symbols": symbols, "repeat": args.repeat, "benchmarks": {}}
+    try:
+        for suite in suites:
+            print(f"Running {suite}...")
+            if suite == "api":
+                results["benchmarks"].update(bench_api(symbols, args.repeat, args.concurrency))
+            else:
+                results["benchmarks"].update(globals()[f"bench_{suite}"](symbols, args.repeat))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    print()
+    for name, summary in results["benchmarks"].items():
+        extra = f"  {summary['throughput_rps']:8.1f} req/s" if "throughput_rps" in summary else ""
+        print(f"  {name:<36} p50 {summary['p50_ms']:9.1f} ms  p95 {summary['p95_ms']:9.1f} ms  n={summary['n']}{extra}")
+    print(f"  peak RSS: {results['peak_rss_mb']['self']:.0f} MB (workers {results['peak_rss_mb']['children']:.0f} MB)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline yet; run with --save-baseline to record one.")
+        return 0
+
+    print("\nComparing with baseline:")
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print(f"\nFAILED: {len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Accuracy parity of a FinBERT inference backend against the fp32 torch model.
+
+Scores the same headlines with both and fails (exit code 1) when the predicted
+labels agree less often than --min-agreement or any class probability drifts
+by more than --max-prob-diff. Also reports how long each backend took.
+
+    cd backend
+    python -m bench.sentiment_parity --backend onnx-int8
+    python -m bench.sentiment_parity --backend torch-int8 --headlines headlines.txt
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from bench.offline import FIXTURES_DIR
+from models.sentiment import BATCH_SIZE, MODEL_NAME, SENTIMENT_THREADS
+from models.sentiment_backends import BACKENDS, load_backend
+
+
+def fixture_headlines():
+    with open(os.path.join(FIXTURES_DIR, "news.json")) as f:
+        payloads = json.load(f)
+    return list(dict.fromkeys(item["headline"] for items in payloads.values() for item in items))
+
+
+def score(backend, headlines):
+    started = time.perf_counter()
+    probs = []
+    for i in range(0, len(headlines), BATCH_SIZE):
+        probs.extend(backend(headlines[i:i + BATCH_SIZE]))
+    return np.array(probs), time.perf_counter() - started
+
+
+def compare(reference, candidate):
+    return {
+        "label_agreement": float((reference.argmax(axis=1) == candidate.argmax(axis=1)).mean()),
+        "max_prob_diff": float(np.abs(reference - candidate).max()),
+        "mean_prob_diff": float(np.abs(reference - candidate).mean()),
+        # The aggregate sentiment score is positive - negative
+        "max_score_diff": float(np.abs((reference[:, 0] - reference[:, 1]) - (candidate[:, 0] - candidate[:, 1])).max()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", required=True, choices=[b for b in BACKENDS if b != "torch"])
+    parser.add_argument("--headlines", help="text file with one headline per line (default: the benchmark fixtures)")
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    parser.add_argument("--max-prob-diff", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    if args.headlines:
+        with open(args.headlines) as f:
+            headlines = [line.strip() for line in f if line.strip()]
+    else:
+        headlines = fixture_headlines()
+
+    reference, reference_time = score(load_backend("torch", MODEL_NAME, SENTIMENT_THREADS), headlines)
+    candidate, candidate_time = score(load_backend(args.backend, MODEL_NAME, SENTIMENT_THREADS), headlines)
+    result = compare(reference, candidate)
+
+    print(f"{len(headlines)} headlines, torch vs {args.backend}")
+    print(f"  label agreement   {result['label_agreement']:.1%}")
+    print(f"  max prob diff     {result['max_prob_diff']:.4f}")
+    print(f"  mean prob diff    {result['mean_prob_diff']:.4f}")
+    print(f"  max score diff    {result['max_score_diff']:.4f}")
+    print(f"  time              torch {reference_time * 1000:.0f} ms, {args.backend} {candidate_time * 1000:.0f} ms")
+
+    failures = []
+    if result["label_agreement"] < args.min_agreement:
+        failures.append(f"label agreement below {args.min_agreement:.0%}")
+    if result["max_prob_diff"] > args.max_prob_diff:
+        failures.append(f"probability drift above {args.max_prob_diff}")
+    if failures:
+        print(f"\nFAILED: {'; '.join(failures)}")
+        return 1
+    print("\nParity OK.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
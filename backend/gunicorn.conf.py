@@ -0,0 +1,17 @@
+"""
+Gunicorn settings for running several API workers from one pre-forked parent.
+
+The app is imported once in the master before workers fork. With
+PRELOAD_MODELS=import that import also loads Prophet and FinBERT, so every
+worker shares those pages copy-on-write instead of loading its own copy:
+
+    PRELOAD_MODELS=import PRECOMPUTE_IN_APP=false gunicorn app:app -c gunicorn.conf.py
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+# Model loads happen before forking, so workers only need the usual boot time
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
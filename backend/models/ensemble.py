@@ -0,0 +1,301 @@
+"""
+Multi-model price forecasting with rolling-origin model selection.
+
+Three cheap numpy models run next to Prophet:
+
+- "drift": random walk with drift on log prices.
+- "holt": damped-trend Holt smoothing of log prices, parameters picked from a small grid.
+- "ar": AR(p) with intercept on log returns, i.e. ARIMA(p, 1, 0) on log prices.
+
+Every model is backtested from the same rolling origins (the last
+FORECAST_CV_FOLDS points of a fixed business-day grid, each followed by
+FORECAST_CV_HORIZON held-out bars). Out-of-sample squared errors weight the
+models (FORECAST_ENSEMBLE=weighted) or pick the single best one (=best), and the
+combined backtest sets the forecast intervals and the directional hit rate
+that `StockPredictor.summarize` reports as confidence.
+
+Models step over trading days; `combine` maps them back onto the calendar-day
+forecast layout of `StockPredictor.forecast`.
+"""
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from models.prediction import StockPredictor, _new_prophet, _stan_init
+from utils.metrics import record_error
+
+logger = logging.getLogger(__name__)
+
+FORECAST_MODELS = [m.strip() for m in os.getenv("FORECAST_MODELS", "drift,holt,ar,prophet").split(",") if m.strip()]
+ENSEMBLE_MODE = os.getenv("FORECAST_ENSEMBLE", "weighted").lower()
+CV_FOLDS = int(os.getenv("FORECAST_CV_FOLDS", "6"))
+# In trading days
+CV_HORIZON = int(os.getenv("FORECAST_CV_HORIZON", "21"))
+CV_STEP = int(os.getenv("FORECAST_CV_STEP", "10"))
+# Origins need enough history behind them for every model to fit
+MIN_TRAIN_BARS = 120
+AR_ORDER = 5
+# Same coverage as Prophet's interval_width=0.95
+INTERVAL_Z = 1.96
+
+# alpha (level), beta (trend), phi (damping) combinations, fitted side by side
+_HOLT_GRID = np.array([
+    (alpha, beta, phi)
+    for alpha in (0.2, 0.4, 0.6, 0.8, 0.95)
+    for beta in (0.01, 0.05, 0.1, 0.2)
+    for phi in (0.8, 0.9, 0.98)
+]).T
+
+
+def drift(close, steps):
+    log = np.log(close)
+    mu = (log[-1] - log[0]) / (len(log) - 1)
+    fitted = np.concatenate([close[:1], close[:-1] * np.exp(mu)])
+    return fitted, close[-1] * np.exp(mu * np.arange(1, steps + 1))
+
+
+def holt(close, steps):
+    y = np.log(close)
+    alpha, beta, phi = _HOLT_GRID
+    level = np.full(alpha.shape, y[0])
+    trend = np.zeros(alpha.shape)
+    fitted = np.empty((len(y), len(alpha)))
+    fitted[0] = y[0]
+    for t in range(1, len(y)):
+        one_step = level + phi * trend
+        fitted[t] = one_step
+        new_level = alpha * y[t] + (1 - alpha) * one_step
+        trend = beta * (new_level - level) + (1 - beta) * phi * trend
+        level = new_level
+    best = np.argmin(((fitted[1:] - y[1:, None]) ** 2).sum(axis=0))
+    damped = np.cumsum(phi[best] ** np.arange(1, steps + 1))
+    return np.exp(fitted[:, best]), np.exp(level[best] + damped * trend[best])
+
+
+def ar(close, steps, order=AR_ORDER):
+    r = np.diff(np.log(close))
+    if len(r) <= 4 * order:
+        return drift(close, steps)
+    # Column k holds lag k + 1 of the target r[order:]
+    X = np.column_stack([np.ones(len(r) - order)] + [r[order - k - 1:len(r) - k - 1] for k in range(order)])
+    coef = np.linalg.lstsq(X, r[order:], rcond=None)[0]
+    fitted = np.concatenate([close[:order + 1], close[order:-1] * np.exp(X @ coef)])
+
+    lags = r[::-1][:order].tolist()
+    predicted = []
+    for _ in range(steps):
+        nxt = coef[0] + float(np.dot(coef[1:], lags))
+        predicted.append(nxt)
+        lags = [nxt] + lags[:-1]
+    return fitted, close[-1] * np.exp(np.cumsum(predicted))
+
+
+CHEAP_MODELS = {"drift": drift, "holt": holt, "ar": ar}
+
+
+def _series(data):
+    close = np.asarray(data["Close"], dtype=np.float64).reshape(-1)
+    dates = pd.DatetimeIndex(data.index)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    return close, dates
+
+
+def future_business_days(last_date, horizon):
+    """
+    Trading days (weekdays) after `last_date`, through the first one on or
+    after `horizon` calendar days out, so every calendar day of the horizon has
+    a trading day to take its forecast from.
+    """
+    last_date = pd.Timestamp(last_date)
+    end = last_date + pd.Timedelta(days=horizon) + pd.offsets.BDay(0)
+    return pd.bdate_range(last_date + pd.Timedelta(days=1), end)
+
+
+def cv_origins(dates, folds=CV_FOLDS, horizon=CV_HORIZON, step=CV_STEP):
+    """
+    Positions of the backtest origins: the last `folds` bars on a fixed grid of
+    every `step`-th business day that still have `horizon` bars after them.
+    Anchoring the grid to the calendar keeps origins stable as bars are added,
+    so a backtest cached days ago lines up with one computed today.
+    """
+    business_day = np.busday_count(np.datetime64("1970-01-01", "D"), dates.values.astype("datetime64[D]"))
+    candidates = [o for o in range(MIN_TRAIN_BARS - 1, len(dates) - horizon) if business_day[o] % step == 0]
+    return candidates[-folds:] if folds > 0 else []
+
+
+def rolling_origin(forecast_fn, close, dates, origins, horizon=CV_HORIZON):
+    """
+    Backtests `forecast_fn(train_bars, steps)` (the next `steps` prices after the
+    first `train_bars` bars) from each origin. Predictions and outcomes are
+    returns relative to the origin's close, so they compare across symbols.
+    """
+    pred, actual = [], []
+    for o in origins:
+        base = close[o]
+        pred.append((np.asarray(forecast_fn(o + 1, horizon), dtype=np.float64) / base - 1).tolist())
+        actual.append((close[o + 1:o + 1 + horizon] / base - 1).tolist())
+    return {"origins": [d.strftime("%Y-%m-%d") for d in dates[origins]], "pred": pred, "actual": actual}
+
+
+def fit_cheap_models(data, horizon, names=None):
+    """Fits and backtests the numpy models in one call; they take milliseconds each."""
+    close, dates = _series(data)
+    steps = len(future_business_days(dates[-1], horizon))
+    origins = cv_origins(dates)
+    results = {}
+    for name in names or [n for n in FORECAST_MODELS if n in CHEAP_MODELS]:
+        model = CHEAP_MODELS[name]
+        started = time.perf_counter()
+        try:
+            fitted, forecast = model(close, steps)
+            cv = rolling_origin(lambda bars, s: model(close[:bars], s)[1], close, dates, origins)
+        except Exception as e:
+            record_error("fit")
+            logger.error(f"{name} forecast error: {e}")
+            continue
+        results[name] = {
+            "fitted": fitted.tolist(),
+            "forecast": forecast.tolist(),
+            "cv": cv,
+            "seconds": time.perf_counter() - started,
+        }
+    return results
+
+
+def fit_prophet(symbol, data, horizon):
+    """
+    Fits (or reuses) the persisted Prophet model and backtests it. The backtest
+    refits Prophet once per fold, so it is saved with the model and only rerun
+    after a cold refit.
+    """
+    started = time.perf_counter()
+    predictor = StockPredictor(symbol)
+    df_prophet = predictor.to_prophet_frame(data)
+    model = predictor.get_model(df_prophet)
+    future = future_business_days(df_prophet['ds'].iloc[-1], horizon)
+    frame = model.predict(pd.DataFrame({"ds": pd.concat([df_prophet['ds'], pd.Series(future)], ignore_index=True)}))
+    yhat = frame['yhat'].to_numpy()
+
+    cv = predictor.saved_cv()
+    if cv is None:
+        init = _stan_init(model)
+
+        def forecast_fn(bars, steps):
+            fold = _new_prophet()
+            fold.fit(df_prophet.iloc[:bars], init=init)
+            return fold.predict(df_prophet[['ds']].iloc[bars:bars + steps])['yhat'].to_numpy()
+
+        close, dates = _series(data)
+        cv = rolling_origin(forecast_fn, close, dates, cv_origins(dates))
+        predictor.save_cv(model, cv)
+
+    return {"prophet": {
+        "fitted": yhat[:len(df_prophet)].tolist(),
+        "forecast": yhat[len(df_prophet):].tolist(),
+        "cv": cv,
+        "seconds": time.perf_counter() - started,
+    }}
+
+
+def _weights(results, mode=ENSEMBLE_MODE):
+    """Inverse out-of-sample MSE weights (or all weight on the lowest MSE with mode "best")."""
+    mse = {
+        name: float(np.mean((np.array(r["cv"]["pred"]) - np.array(r["cv"]["actual"])) ** 2))
+        for name, r in results.items() if r.get("cv") and r["cv"]["pred"]
+    }
+    if not mse:
+        return {name: 1 / len(results) for name in results}, mse
+    if mode == "best":
+        best = min(mse, key=mse.get)
+        return {name: float(name == best) for name in results}, mse
+    inverse = {name: 1 / max(value, 1e-12) for name, value in mse.items()}
+    total = sum(inverse.values())
+    return {name: inverse.get(name, 0.0) / total for name in results}, mse
+
+
+def _ensemble_backtest(results, weights):
+    """Backtest of the weighted combination over the origins every weighted model shares."""
+    members = [name for name, w in weights.items() if w > 0 and results[name].get("cv")]
+    if not members:
+        return None
+    by_origin = [dict(zip(results[n]["cv"]["origins"], range(len(results[n]["cv"]["origins"])))) for n in members]
+    common = [o for o in results[members[0]]["cv"]["origins"] if all(o in index for index in by_origin)]
+    if not common:
+        return None
+    total = sum(weights[n] for n in members)
+    pred = sum(
+        weights[n] / total * np.array([results[n]["cv"]["pred"][index[o]] for o in common])
+        for n, index in zip(members, by_origin)
+    )
+    actual = np.array([results[members[0]]["cv"]["actual"][by_origin[0][o]] for o in common])
+    errors = pred - actual
+    steps = np.arange(1, errors.shape[1] + 1)
+    rmse = np.sqrt((errors ** 2).mean(axis=0))
+    return {
+        "origins": common,
+        "horizon": int(errors.shape[1]),
+        "rmse": rmse.tolist(),
+        "hit_rate": (np.sign(pred) == np.sign(actual)).mean(axis=0).tolist(),
+        # Relative error grows roughly with the square root of the steps ahead
+        "error_scale": float((rmse * np.sqrt(steps)).sum() / steps.sum()),
+    }
+
+
+def combine(symbol, data, horizon, results, partial=False, mode=ENSEMBLE_MODE):
+    """
+    Builds a `StockPredictor.forecast`-shaped result from per-model fits, plus
+    "models" (weights and backtest scores), "cv" (the ensemble's backtest) and
+    "partial" (True while Prophet is still fitting and left out).
+    """
+    close, dates = _series(data)
+    weights, mse = _weights(results, mode)
+    backtest = _ensemble_backtest(results, weights)
+
+    fitted = sum(w * np.asarray(results[n]["fitted"]) for n, w in weights.items())
+    future = sum(w * np.asarray(results[n]["forecast"]) for n, w in weights.items())
+    if backtest:
+        scale = backtest["error_scale"]
+    else:
+        # No usable backtest (short history): fall back to in-sample one-step errors
+        scale = float(np.std(close[1:] / fitted[1:] - 1))
+    in_sample = INTERVAL_Z * float(np.std(close[1:] / fitted[1:] - 1))
+
+    # Calendar days take the first trading-day step on or after them, so a
+    # 1-day horizon from a Friday close is Monday's forecast, not Friday's close
+    business_days = future_business_days(dates[-1], horizon)
+    calendar = pd.date_range(dates[-1] + pd.Timedelta(days=1), periods=horizon, freq="D")
+    steps = business_days.searchsorted(calendar, side="left") + 1
+    yhat = np.concatenate([[close[-1]], future])[steps]
+    width = INTERVAL_Z * scale * np.sqrt(np.maximum(steps, 1))
+
+    returns = data['Close'].pct_change().dropna()
+    return {
+        "symbol": symbol,
+        "last_date": dates[-1].strftime('%Y-%m-%d'),
+        "horizon": horizon,
+        "history_len": len(close),
+        "current_price": float(close[-1]),
+        "volatility": float(returns.std()),
+        "market_regime": StockPredictor(symbol).get_market_regime(data),
+        "forecast": {
+            "ds": (np.concatenate([dates.values, calendar.values]).astype("datetime64[s]").astype(np.int64)).tolist(),
+            "yhat": np.concatenate([fitted, yhat]).tolist(),
+            "yhat_lower": np.concatenate([fitted * (1 - in_sample), yhat * (1 - width)]).tolist(),
+            "yhat_upper": np.concatenate([fitted * (1 + in_sample), yhat * (1 + width)]).tolist(),
+        },
+        "method": mode,
+        "partial": partial,
+        "models": {
+            name: {
+                "weight": weights[name],
+                "cv_rmse": float(np.sqrt(mse[name])) if name in mse else None,
+                "seconds": results[name]["seconds"],
+            }
+            for name in results
+        },
+        "cv": backtest,
+    }
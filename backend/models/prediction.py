@@ -1,50 +1,168 @@
 import numpy as np
 import pandas as pd
-import yfinance as yf
-from datetime import datetime, timedelta
+import importlib.util
+import json
 import os
-from prophet import Prophet
+import re
+import tempfile
+import threading
+from datetime import datetime
 import logging
 
+from utils.indicators import classify_regime
+from utils.market_data import market_data
+from utils.metrics import span
+
 # Suppress Prophet logging to keep output clean
 logging.getLogger('prophet').setLevel(logging.ERROR)
 logging.getLogger('cmdstanpy').setLevel(logging.ERROR)
 
+# A saved fit is warm-started when at most this many bars were added since it was made
+WARM_START_MAX_NEW_BARS = int(os.getenv("WARM_START_MAX_NEW_BARS", "5"))
+# Warm starts drift from a clean fit over time, so refit from scratch on this schedule
+COLD_REFIT_DAYS = float(os.getenv("COLD_REFIT_DAYS", "7"))
+# One forecast per data version covers every requested `days` up to this horizon
+MAX_FORECAST_DAYS = int(os.getenv("MAX_FORECAST_DAYS", "90"))
+
+def _stan_init(model):
+    """Extracts fitted parameters to seed the optimizer of a new fit."""
+    res = {}
+    for pname in ['k', 'm', 'sigma_obs']:
+        res[pname] = float(model.params[pname][0][0])
+    for pname in ['delta', 'beta']:
+        # Arrays: Prophet compares their shapes with its default inits
+        res[pname] = np.array(model.params[pname][0], dtype=float)
+    return res
+
+# Prophet pulls in cmdstanpy and takes seconds to import, so it is loaded on first use
+HAS_PROPHET = importlib.util.find_spec("prophet") is not None
+_prophet = None
+_prophet_lock = threading.Lock()
+
+def load_prophet():
+    """Imports Prophet once per process and returns the module."""
+    global _prophet
+    if _prophet is None:
+        with _prophet_lock:
+            if _prophet is None:
+                with span("model_load"):
+                    import prophet
+                    import prophet.serialize
+                _prophet = prophet
+    return _prophet
+
+def prophet_loaded():
+    return _prophet is not None
+
+def _new_prophet():
+    return load_prophet().Prophet(
+        daily_seasonality=False,
+        weekly_seasonality=True,
+        yearly_seasonality=True,
+        interval_width=0.95
+    )
+
 class StockPredictor:
     def __init__(self, symbol, timeframe='1y'):
         self.symbol = symbol
         self.timeframe = timeframe
         self.look_back = 60
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.save_dir = os.path.join(base_dir, "saved_models")
+        self.save_dir = os.getenv("SAVED_MODELS_DIR", os.path.join(base_dir, "saved_models"))
 
     def fetch_data(self, period="2y"):
         try:
-            # Prophet works better with more data, 2y is a good default for daily predictions
-            data = yf.download(self.symbol, period=period, progress=False)
-            if data.empty:
-                # Fallback for some symbols or periods
-                data = yf.download(self.symbol, start=(datetime.now() - timedelta(days=730)).strftime('%Y-%m-%d'), progress=False)
-            
-            if not data.empty and isinstance(data.columns, pd.MultiIndex):
-                # Flatten MultiIndex columns (yfinance 0.2.0+ often returns them)
-                data.columns = data.columns.get_level_values(0)
-                
-            return data
+            # Prophet works better with more data, 2y is a good default for daily predictions.
+            # History is served from the shared store, which only downloads new bars.
+            return market_data.get_history(self.symbol, period=period)
         except Exception as e:
             print(f"Error fetching data for {self.symbol}: {e}")
             return pd.DataFrame()
 
-    def train(self, epochs=5, batch_size=32, force=False):
-        # Prophet fits very quickly for single series, so we can fit it during prediction.
-        # This method is kept to maintain API compatibility with the existing backend.
-        return True
+    def _model_path(self):
+        safe_symbol = re.sub(r'[^\w.-]', '', self.symbol)
+        return os.path.join(self.save_dir, f"{safe_symbol}_prophet.json")
 
-    def predict(self, days=30):
-        data = self.fetch_data(period="2y")
-        if data.empty:
+    def _load_state(self):
+        try:
+            with open(self._model_path(), 'r') as f:
+                state = json.load(f)
+            state["model"] = load_prophet().serialize.model_from_json(state["model"])
+            return state
+        except FileNotFoundError:
             return None
-            
+        except Exception as e:
+            print(f"Could not load saved model for {self.symbol}: {e}")
+            return None
+
+    def _save_state(self, model, last_date, cold_fit_at, cv=None):
+        state = {
+            "symbol": self.symbol,
+            "last_date": last_date,
+            "cold_fit_at": cold_fit_at,
+            "cv": cv,
+            "model": load_prophet().serialize.model_to_json(model),
+        }
+        tmp_path = None
+        try:
+            os.makedirs(self.save_dir, exist_ok=True)
+            # Fits for the same symbol may finish concurrently in different workers
+            fd, tmp_path = tempfile.mkstemp(dir=self.save_dir, prefix=".tmp-")
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self._model_path())
+            tmp_path = None
+        except Exception as e:
+            print(f"Could not save model for {self.symbol}: {e}")
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_model(self, df_prophet, force=False):
+        """
+        Returns a Prophet model fitted on `df_prophet`, reusing saved state:
+        the saved model as-is if no bars were added, a warm-started refit if only
+        a few were, otherwise (or when forced / the cold fit is too old) a fresh fit.
+        """
+        last_date = df_prophet['ds'].iloc[-1].strftime('%Y-%m-%d')
+        now = datetime.now().timestamp()
+        state = None if force else self._load_state()
+
+        init = None
+        cold_fit_at = now
+        cv = None
+        if state is not None and (now - state["cold_fit_at"]) < COLD_REFIT_DAYS * 86400:
+            if state["last_date"] == last_date:
+                self._fit_meta = {"last_date": last_date, "cold_fit_at": state["cold_fit_at"], "cv": state.get("cv")}
+                return state["model"]
+            new_bars = int((df_prophet['ds'] > pd.Timestamp(state["last_date"])).sum())
+            if 0 < new_bars <= WARM_START_MAX_NEW_BARS:
+                init = _stan_init(state["model"])
+                cold_fit_at = state["cold_fit_at"]
+                # Warm starts stay close to the cold fit, so its backtest still describes them
+                cv = state.get("cv")
+
+        model = _new_prophet()
+        if init is not None:
+            model.fit(df_prophet, init=init)
+        else:
+            model.fit(df_prophet)
+        self._save_state(model, last_date, cold_fit_at, cv)
+        self._fit_meta = {"last_date": last_date, "cold_fit_at": cold_fit_at, "cv": cv}
+        return model
+
+    def saved_cv(self):
+        """Backtest results stored with the model last returned by `get_model`, if any."""
+        return getattr(self, "_fit_meta", {}).get("cv")
+
+    def save_cv(self, model, cv):
+        """Stores backtest results with the saved fit; they are dropped at the next cold refit."""
+        meta = self._fit_meta
+        meta["cv"] = cv
+        self._save_state(model, meta["last_date"], meta["cold_fit_at"], cv)
+
+    @staticmethod
+    def to_prophet_frame(data):
         # Prepare data for Prophet: needs columns 'ds' and 'y'
         # Prophet expects 'ds' (datestamp) and 'y' (value to predict)
         df_prophet = data.reset_index()[['Date', 'Close']]
@@ -53,96 +171,148 @@ class StockPredictor:
         # Remove timezone if exists (Prophet requirement)
         if df_prophet['ds'].dt.tz is not None:
             df_prophet['ds'] = df_prophet['ds'].dt.tz_localize(None)
-            
+        return df_prophet
+
+    def train(self, epochs=5, batch_size=32, force=False):
+        # `epochs`/`batch_size` are kept for API compatibility; Prophet has no epochs.
+        # Fits (or warm-starts) the model for the latest data and persists it.
+        data = self.fetch_data(period="2y")
+        if data.empty:
+            return False
         try:
-            # Initialize and fit model
-            model = Prophet(
-                daily_seasonality=False,
-                weekly_seasonality=True,
-                yearly_seasonality=True,
-                interval_width=0.95
-            )
-            model.fit(df_prophet)
-            
-            # Predict for the next N days
-            future = model.make_future_dataframe(periods=days)
-            forecast = model.predict(future)
+            self.get_model(self.to_prophet_frame(data), force=force)
+            return True
+        except Exception as e:
+            print(f"Prophet training error for {self.symbol}: {e}")
+            return False
+
+    def forecast(self, data=None, horizon=None):
+        """
+        Fits (or reuses) the model and forecasts `horizon` days past the last bar.
+        The result carries everything `summarize` needs, so one forecast can
+        answer any `days` up to its horizon without another fit.
+        """
+        horizon = horizon or MAX_FORECAST_DAYS
+        # `data` lets callers fetch on an I/O thread and fit in a worker process
+        if data is None:
+            data = self.fetch_data(period="2y")
+        if data.empty:
+            return None
             
-            # Extract historical fit and future predictions
-            # We want to return a list of dates and their corresponding yhat values
-            forecast_data = {
-                "ds": (forecast['ds'].astype(int) // 10**9).tolist(),
-                "yhat": forecast['yhat'].tolist(),
-                "yhat_lower": forecast['yhat_lower'].tolist(),
-                "yhat_upper": forecast['yhat_upper'].tolist(),
-            }
+        df_prophet = self.to_prophet_frame(data)
             
-            # Get the last current price and the next predicted price (tomorrow)
-            current_price = float(df_prophet['y'].iloc[-1])
-            # Index of tomorrow is len(df_prophet)
-            # Use min to avoid index out of bounds if days < 1 (though shouldn't happen)
-            predicted_idx = min(len(df_prophet), len(forecast) - 1)
-            predicted_price = float(forecast['yhat'].iloc[predicted_idx])
+        try:
+            # Reuse the persisted fit when the data has not moved on
+            model = self.get_model(df_prophet)
             
-            # Calculate expected return percentage for the selected horizon
-            final_predicted_price = float(forecast['yhat'].iloc[-1])
-            expected_return = float(((final_predicted_price - current_price) / current_price) * 100)
+            # Predict out to the maximum horizon
+            future = model.make_future_dataframe(periods=horizon)
+            forecast = model.predict(future)
             
             # Calculate volatility for risk assessment
             returns = data['Close'].pct_change().dropna()
-            volatility = float(returns.std())
-            
-            # Confidence score based on Prophet's uncertainty interval at the end of horizon
-            uncertainty = float(forecast['yhat_upper'].iloc[-1] - forecast['yhat_lower'].iloc[-1])
-            uncertainty_percent = uncertainty / final_predicted_price if final_predicted_price != 0 else 0
             
-            # Score: 100 - (scaled uncertainty and volatility)
-            confidence = max(40, min(95, 100 - (uncertainty_percent * 500) - (volatility * 1000)))
-            
-            # Risk level based on volatility
-            if volatility > 0.03:
-                risk_level = "High"
-            elif volatility > 0.015:
-                risk_level = "Medium"
-            else:
-                risk_level = "Low"
-                
             return {
-                "predicted_price": predicted_price,
-                "expected_return": expected_return,
-                "confidence": float(confidence),
-                "risk_level": risk_level,
-                "signal": "BUY" if expected_return > 1 else "SELL" if expected_return < -1 else "HOLD",
-                "current_price": current_price,
+                "symbol": self.symbol,
+                "last_date": df_prophet['ds'].iloc[-1].strftime('%Y-%m-%d'),
+                "horizon": horizon,
+                "history_len": len(df_prophet),
+                "current_price": float(df_prophet['y'].iloc[-1]),
+                "volatility": float(returns.std()),
                 "market_regime": self.get_market_regime(data),
-                "forecast": forecast_data
+                # Historical fit followed by the future predictions
+                "forecast": {
+                    "ds": (forecast['ds'].astype(int) // 10**9).tolist(),
+                    "yhat": forecast['yhat'].tolist(),
+                    "yhat_lower": forecast['yhat_lower'].tolist(),
+                    "yhat_upper": forecast['yhat_upper'].tolist(),
+                },
             }
         except Exception as e:
             print(f"Prophet prediction error for {self.symbol}: {e}")
             return None
 
+    @staticmethod
+    def summarize(base, days):
+        """Builds the prediction for a `days` horizon by slicing a `forecast()` result."""
+        if not base:
+            return None
+        days = max(1, min(days, base["horizon"]))
+        end = base["history_len"] + days
+        forecast_data = {key: values[:end] for key, values in base["forecast"].items()}
+        yhat = forecast_data["yhat"]
+        
+        # Index of tomorrow is history_len
+        current_price = base["current_price"]
+        predicted_price = float(yhat[base["history_len"]])
+        
+        # Calculate expected return percentage for the selected horizon
+        final_predicted_price = float(yhat[-1])
+        expected_return = float(((final_predicted_price - current_price) / current_price) * 100)
+        volatility = base["volatility"]
+        
+        cv = base.get("cv")
+        accuracy = None
+        if cv:
+            # Ensemble forecasts (models/ensemble.py): confidence is the share of
+            # backtest forecasts, up to this many trading days ahead, that called the direction
+            steps = max(1, round(days * 5 / 7))
+            confidence = 100 * float(np.mean(cv["hit_rate"][:steps]))
+            accuracy = {
+                "directional_hit_rate": confidence / 100,
+                "expected_error_pct": 100 * cv["error_scale"] * float(np.sqrt(steps)),
+                "backtest_origins": len(cv["origins"]),
+                "models": base.get("models"),
+                "partial": base.get("partial", False),
+            }
+        else:
+            # Confidence score based on Prophet's uncertainty interval at the end of horizon
+            uncertainty = float(forecast_data["yhat_upper"][-1] - forecast_data["yhat_lower"][-1])
+            uncertainty_percent = uncertainty / final_predicted_price if final_predicted_price != 0 else 0
+
+            # Score: 100 - (scaled uncertainty and volatility)
+            confidence = max(40, min(95, 100 - (uncertainty_percent * 500) - (volatility * 1000)))
+        
+        # Risk level based on volatility
+        if volatility > 0.03:
+            risk_level = "High"
+        elif volatility > 0.015:
+            risk_level = "Medium"
+        else:
+            risk_level = "Low"
+            
+        return {
+            "predicted_price": predicted_price,
+            "expected_return": expected_return,
+            "confidence": float(confidence),
+            "risk_level": risk_level,
+            "signal": "BUY" if expected_return > 1 else "SELL" if expected_return < -1 else "HOLD",
+            "current_price": current_price,
+            "market_regime": base["market_regime"],
+            "accuracy": accuracy,
+            "forecast": forecast_data
+        }
+
+    def predict(self, days=30, data=None):
+        return self.summarize(self.forecast(data=data, horizon=max(days, MAX_FORECAST_DAYS)), days)
+
     def get_market_regime(self, data):
         try:
             # Extract close prices correctly
             close_prices = data['Close']
-            
-            # Use last 60 days for SMA calculation
-            last_prices = close_prices.tail(60)
-            if last_prices.empty:
+            if close_prices.empty:
                 return "Unknown"
 
+            # The shared store keeps this incrementally; use it when `data` ends at its latest bar
+            latest = market_data.indicators(self.symbol)
+            if latest and latest["date"] == data.index[-1].strftime('%Y-%m-%d'):
+                return latest["regime"]
+
+            # Use last 60 days for SMA calculation
+            last_prices = close_prices.tail(60)
             sma20 = last_prices.rolling(window=20).mean().iloc[-1]
             sma50 = last_prices.rolling(window=50).mean().iloc[-1]
-            current_price = last_prices.iloc[-1]
-            
-            if current_price > sma20 > sma50:
-                return "Trending Up"
-            elif current_price < sma20 < sma50:
-                return "Trending Down"
-            elif abs(sma20 - sma50) / (sma50 if sma50 != 0 else 1) < 0.02:
-                return "Sideways"
-            else:
-                return "Volatile"
+            return classify_regime(float(last_prices.iloc[-1]), float(sma20), float(sma50))
         except Exception as e:
             print(f"Error calculating market regime: {e}")
             return "Unknown"
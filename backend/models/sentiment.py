@@ -1,71 +1,203 @@
-try:
-    from transformers import AutoTokenizer, AutoModelForSequenceClassification
-    import torch
-    HAS_TRANSFORMERS = True
-except ImportError:
-    HAS_TRANSFORMERS = False
-
-import requests
+import hashlib
 import os
+import sqlite3
+import threading
 from dotenv import load_dotenv
 import datetime
 
+from models.sentiment_backends import backend_available, load_backend
+from utils.metrics import record_error, span
+from utils.news_client import FinnhubNewsClient, NewsFetchError
+
 load_dotenv()
 
+MODEL_NAME = "ProsusAI/finbert"
+MAX_HEADLINES = 10
+BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "32"))
+# torch | torch-int8 | onnx | onnx-int8, see models/sentiment_backends.py
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "torch").lower()
+SENTIMENT_THREADS = int(os.getenv("SENTIMENT_THREADS", "0")) or None
+
+# transformers and the runtime are only imported when the model is first loaded
+HAS_TRANSFORMERS = backend_available(SENTIMENT_BACKEND)
+HEADLINE_CACHE_PATH = os.getenv(
+    "HEADLINE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "headline_scores.db"),
+)
+
+
+class HeadlineScoreStore:
+    """Persistent cache of FinBERT probabilities keyed by a hash of the headline text."""
+
+    def __init__(self, path=HEADLINE_CACHE_PATH, model_name=MODEL_NAME):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Opened per process: a connection inherited across a fork must not be reused
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._pid = os.getpid()
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS headline_scores ("
+                "hash TEXT PRIMARY KEY, positive REAL, negative REAL, neutral REAL, scored_at TEXT)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def key(self, headline):
+        return hashlib.sha1(f"{self.model_name}\n{headline}".encode()).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._connection().execute(
+                    f"SELECT hash, positive, negative, neutral FROM headline_scores WHERE hash IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update({row[0]: row[1:] for row in rows})
+        return found
+
+    def put_many(self, scores):
+        now = datetime.datetime.now().isoformat()
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO headline_scores VALUES (?, ?, ?, ?, ?)",
+                [(key, pos, neg, neu, now) for key, (pos, neg, neu) in scores.items()],
+            )
+            conn.commit()
+
+
 class SentimentAnalyzer:
-    def __init__(self):
-        self.enabled = False
-        if HAS_TRANSFORMERS:
-            try:
-                self.tokenizer = AutoTokenizer.from_pretrained("ProsusAI/finbert")
-                self.model = AutoModelForSequenceClassification.from_pretrained("ProsusAI/finbert", use_safetensors=True)
-                self.enabled = True
-            except Exception as e:
-                print(f"Sentiment initialization failed: {e}")
-        
+    def __init__(self, backend=None):
+        # FinBERT is loaded on first inference (or by `load`); `enabled` drops to False if that fails
+        self.backend_name = backend or SENTIMENT_BACKEND
+        self.enabled = backend_available(self.backend_name)
+        self.backend = None
+        self._load_lock = threading.Lock()
+
         self.finnhub_api_key = os.getenv("NEXT_PUBLIC_FINNHUB_API_KEY")
+        self.news = FinnhubNewsClient(api_key=self.finnhub_api_key)
+        # Quantized backends score slightly differently, so they keep their own cached scores
+        score_model = MODEL_NAME if self.backend_name == "torch" else f"{MODEL_NAME}@{self.backend_name}"
+        self.scores = HeadlineScoreStore(model_name=score_model)
 
-    def get_sentiment(self, symbol):
+    @property
+    def loaded(self):
+        return self.backend is not None
+
+    def load(self):
+        """Loads the configured inference backend once; returns whether the analyzer is usable."""
+        if self.backend is not None or not self.enabled:
+            return self.enabled
+        with self._load_lock:
+            if self.backend is None and self.enabled:
+                try:
+                    with span("model_load"):
+                        self.backend = load_backend(self.backend_name, MODEL_NAME, threads=SENTIMENT_THREADS)
+                except Exception as e:
+                    print(f"Sentiment initialization failed ({self.backend_name}): {e}")
+                    self.enabled = False
+        return self.enabled
+
+    def _fetch_headlines(self, symbol):
+        """Returns (headlines, None) or (None, offline_result)."""
+        try:
+            news = self.news.company_news(symbol, days=7)
+        except NewsFetchError as e:
+            print(f"News fetch failed for {symbol}: {e}")
+            return None, {"sentiment": "Neutral", "score": 0.0, "count": 0, "status": "API Error"}
+
+        if not news:
+            return None, {"sentiment": "Neutral", "score": 0.0, "count": 0, "status": "No News"}
+
+        return [item['headline'] for item in news[:MAX_HEADLINES]], None
+
+    def _infer(self, headlines):
+        """Runs FinBERT over `headlines` in padded batches; returns [(pos, neg, neu), ...]."""
+        if not self.load():
+            raise RuntimeError("Sentiment model could not be loaded")
+
+        probs = []
+        for i in range(0, len(headlines), BATCH_SIZE):
+            probs.extend(self.backend(headlines[i:i + BATCH_SIZE]))
+        return probs
+
+    def score_headlines(self, headlines):
+        """Returns {headline: (pos, neg, neu)}, running the model only on headlines never scored before."""
+        unique = list(dict.fromkeys(headlines))
+        keys = {h: self.scores.key(h) for h in unique}
+        cached = self.scores.get_many(keys.values())
+
+        unseen = [h for h in unique if keys[h] not in cached]
+        if unseen:
+            fresh = dict(zip(unseen, self._infer(unseen)))
+            self.scores.put_many({keys[h]: p for h, p in fresh.items()})
+            cached.update({keys[h]: p for h, p in fresh.items()})
+
+        return {h: cached[keys[h]] for h in unique}
+
+    @staticmethod
+    def _aggregate(probs):
+        pos = sum(p[0] for p in probs) / len(probs)
+        neg = sum(p[1] for p in probs) / len(probs)
+        neu = sum(p[2] for p in probs) / len(probs)
+
+        sentiment = "Positive" if pos > neg and pos > neu else "Negative" if neg > pos and neg > neu else "Neutral"
+        score = pos - neg
+
+        return {
+            "sentiment": sentiment,
+            "score": score,
+            "positive": pos,
+            "negative": neg,
+            "neutral": neu,
+            "count": len(probs)
+        }
+
+    def get_sentiment_many(self, symbols):
+        """
+        Scores news for several symbols at once. Headlines are gathered for every
+        symbol, deduplicated, and only those missing from the score cache go
+        through the model; per-symbol results are aggregated from the scores.
+        """
         if not self.enabled:
-            return {"sentiment": "Neutral", "score": 0.0, "count": 0, "status": "Model Offline"}
-            
+            return {s: {"sentiment": "Neutral", "score": 0.0, "count": 0, "status": "Model Offline"} for s in symbols}
+
+        results = {}
+        headlines_by_symbol = {}
+        for symbol in symbols:
+            try:
+                headlines, offline = self._fetch_headlines(symbol)
+            except Exception as e:
+                record_error("sentiment")
+                headlines, offline = None, {"sentiment": "Neutral", "score": 0.0, "count": 0, "status": f"Error: {str(e)}"}
+            if offline:
+                results[symbol] = offline
+            else:
+                headlines_by_symbol[symbol] = headlines
+
         try:
-            end = datetime.date.today().strftime('%Y-%m-%d')
-            start = (datetime.date.today() - datetime.timedelta(days=7)).strftime('%Y-%m-%d')
-            
-            url = f"https://finnhub.io/api/v1/company-news?symbol={symbol}&from={start}&to={end}&token={self.finnhub_api_key}"
-            response = requests.get(url)
-            
-            if response.status_code != 200:
-                return {"sentiment": "Neutral", "score": 0.0, "count": 0, "status": "API Error"}
-                
-            news = response.json()
-            if not news:
-                return {"sentiment": "Neutral", "score": 0.0, "count": 0, "status": "No News"}
-                
-            headlines = [item['headline'] for item in news[:10]]
-            
-            inputs = self.tokenizer(headlines, padding=True, truncation=True, return_tensors="pt")
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-            
-            predictions = torch.nn.functional.softmax(outputs.logits, dim=-1)
-            mean_predictions = predictions.mean(dim=0)
-            
-            pos = float(mean_predictions[0])
-            neg = float(mean_predictions[1])
-            neu = float(mean_predictions[2])
-            
-            sentiment = "Positive" if pos > neg and pos > neu else "Negative" if neg > pos and neg > neu else "Neutral"
-            score = pos - neg
-            
-            return {
-                "sentiment": sentiment,
-                "score": score,
-                "positive": pos,
-                "negative": neg,
-                "neutral": neu,
-                "count": len(headlines)
-            }
+            scores = self.score_headlines([h for hs in headlines_by_symbol.values() for h in hs])
         except Exception as e:
-            return {"sentiment": "Neutral", "score": 0.0, "count": 0, "status": f"Error: {str(e)}"}
+            record_error("sentiment")
+            status = f"Error: {str(e)}" if self.enabled else "Model Offline"
+            for symbol in headlines_by_symbol:
+                results[symbol] = {"sentiment": "Neutral", "score": 0.0, "count": 0, "status": status}
+            return results
+
+        for symbol, headlines in headlines_by_symbol.items():
+            results[symbol] = self._aggregate([scores[h] for h in headlines])
+        return results
+
+    def get_sentiment(self, symbol):
+        return self.get_sentiment_many([symbol])[symbol]
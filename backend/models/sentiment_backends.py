@@ -0,0 +1,170 @@
+"""
+CPU inference backends for FinBERT, selected with SENTIMENT_BACKEND.
+
+Every backend maps a batch of headlines to [(positive, negative, neutral), ...]:
+
+- "torch": the full-precision PyTorch model, the reference for the others.
+- "torch-int8": the same model with its Linear layers dynamically quantized to int8.
+- "onnx": an ONNX Runtime session over the model, exported once to SENTIMENT_ONNX_DIR.
+- "onnx-int8": that export with its weights dynamically quantized to int8.
+
+bench/sentiment_parity.py compares any of them against "torch".
+"""
+import importlib.util
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from utils.metrics import span
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+ONNX_DIR = os.getenv(
+    "SENTIMENT_ONNX_DIR",
+    os.path.join(
+        os.getenv("SAVED_MODELS_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "saved_models")),
+        "finbert-onnx",
+    ),
+)
+ONNX_OPSET = 17
+LABELS = ("positive", "negative", "neutral")
+
+
+def backend_available(name):
+    """Whether `name` is known and the packages it needs at inference time are installed (without importing them)."""
+    if name not in BACKENDS:
+        return False
+    runtime = "onnxruntime" if name.startswith("onnx") else "torch"
+    return all(importlib.util.find_spec(pkg) is not None for pkg in ("transformers", runtime))
+
+
+def _label_order(config):
+    """Logit columns holding (positive, negative, neutral), read from the model config."""
+    names = {str(label).lower(): int(i) for i, label in (getattr(config, "id2label", None) or {}).items()}
+    if all(label in names for label in LABELS):
+        return [names[label] for label in LABELS]
+    return [0, 1, 2]
+
+
+def _probabilities(logits, order):
+    logits = np.asarray(logits, dtype=np.float64)[:, order]
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return [tuple(p) for p in (exp / exp.sum(axis=1, keepdims=True)).tolist()]
+
+
+class TorchBackend:
+    def __init__(self, model_name, threads=None, quantize=False):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+        if threads:
+            # Process-wide: the sentiment stage is the only torch user
+            torch.set_num_threads(threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name, use_safetensors=True).eval()
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.order = _label_order(model.config)
+
+    def __call__(self, headlines):
+        import torch
+
+        with span("tokenize"):
+            inputs = self.tokenizer(headlines, padding=True, truncation=True, return_tensors="pt")
+        with span("inference"), torch.no_grad():
+            logits = self.model(**inputs).logits
+        return _probabilities(logits.float().numpy(), self.order)
+
+
+def _build_once(target_dir, build):
+    """
+    Returns target_dir/model.onnx, running `build(path)` into a scratch directory
+    and moving it into place first if it does not exist yet. Workers racing on
+    the first build each write their own copy; the first rename wins.
+    """
+    path = os.path.join(target_dir, "model.onnx")
+    if os.path.exists(path):
+        return path
+    parent = os.path.dirname(target_dir)
+    os.makedirs(parent, exist_ok=True)
+    scratch = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        # A directory, since large exports keep their weights in side files
+        build(os.path.join(scratch, "model.onnx"))
+        try:
+            os.replace(scratch, target_dir)
+        except OSError:
+            if not os.path.exists(path):
+                raise
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return path
+
+
+def export_onnx(model_name, onnx_dir=ONNX_DIR):
+    """Exports the fp32 model to ONNX once; needs torch only the first time."""
+    def build(path):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name, use_safetensors=True).eval()
+        sample = tokenizer(["Shares rise after quarterly earnings beat estimates"], return_tensors="pt")
+        # Positional order of BERT's forward()
+        names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+        with torch.no_grad():
+            torch.onnx.export(
+                model, tuple(sample[n] for n in names), path,
+                input_names=names,
+                output_names=["logits"],
+                dynamic_axes={**{n: {0: "batch", 1: "sequence"} for n in names}, "logits": {0: "batch"}},
+                opset_version=ONNX_OPSET,
+            )
+
+    return _build_once(os.path.join(onnx_dir, "fp32"), build)
+
+
+def quantize_onnx(fp32_path, onnx_dir=ONNX_DIR):
+    def build(path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+
+    return _build_once(os.path.join(onnx_dir, "int8"), build)
+
+
+class OnnxBackend:
+    def __init__(self, model_name, threads=None, quantize=False, onnx_dir=ONNX_DIR):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        path = export_onnx(model_name, onnx_dir)
+        if quantize:
+            path = quantize_onnx(path, onnx_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.order = _label_order(AutoConfig.from_pretrained(model_name))
+
+    def __call__(self, headlines):
+        with span("tokenize"):
+            inputs = self.tokenizer(headlines, padding=True, truncation=True, return_tensors="np")
+        with span("inference"):
+            logits = self.session.run(None, {n: inputs[n].astype(np.int64) for n in self.input_names})[0]
+        return _probabilities(logits, self.order)
+
+
+def load_backend(name, model_name, threads=None):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown sentiment backend: {name} (expected one of {', '.join(BACKENDS)})")
+    quantize = name.endswith("-int8")
+    if name.startswith("onnx"):
+        return OnnxBackend(model_name, threads=threads, quantize=quantize)
+    return TorchBackend(model_name, threads=threads, quantize=quantize)
@@ -0,0 +1,32 @@
+"""
+Standalone precompute worker.
+
+Runs the same refresh pipeline as the API's in-process scheduler, writing into
+the shared cache directory. Use it when the API runs several uvicorn workers
+(set PRECOMPUTE_IN_APP=false there so only this process refreshes):
+
+    python precompute_worker.py
+"""
+import asyncio
+import logging
+
+from app import popularity, precompute
+from utils.scheduler import PrecomputeScheduler
+from utils.workers import pools
+
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    scheduler = PrecomputeScheduler(precompute, popularity, reload_popularity=True)
+    logger.info(f"Precompute worker started for {scheduler.symbols or 'popular symbols'}")
+    await scheduler.run_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pools.shutdown(wait=True)
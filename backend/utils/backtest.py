@@ -1,63 +1,194 @@
-import pandas as pd
 import numpy as np
-import yfinance as yf
-from datetime import datetime, timedelta
 
-def run_backtest(symbol, strategy='sma_crossover'):
-    # Fetch historical data
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=365) # 1 year backtest
-    data = yf.download(symbol, start=start_date, end=end_date, progress=False)
-    
-    if data.empty:
-        return None
-
-    if isinstance(data.columns, pd.MultiIndex):
-        data.columns = data.columns.get_level_values(0)
-
-    # Simple Strategy: SMA 20/50 Crossover
-    data['SMA20'] = data['Close'].rolling(window=20).mean()
-    data['SMA50'] = data['Close'].rolling(window=50).mean()
-    
-    data['Signal'] = 0.0
-    data['Signal'] = np.where(data['SMA20'] > data['SMA50'], 1.0, 0.0)
-    data['Position'] = data['Signal'].diff()
-    
-    # Calculate Returns
-    data['Market Returns'] = data['Close'].pct_change()
-    data['Strategy Returns'] = data['Market Returns'] * data['Signal'].shift(1)
-    
-    # Cumulative Returns
-    cumulative_market_returns = (1 + data['Market Returns']).cumprod() - 1
-    cumulative_strategy_returns = (1 + data['Strategy Returns']).cumprod() - 1
-    
-    # Performance Metrics
-    total_return = cumulative_strategy_returns.iloc[-1]
-    annual_return = (1 + total_return) ** (252 / len(data)) - 1
-    annual_vol = data['Strategy Returns'].std() * np.sqrt(252)
-    sharpe_ratio = annual_return / annual_vol if annual_vol != 0 else 0
-    
-    # Max Drawdown
-    cum_returns = (1 + data['Strategy Returns']).cumprod()
-    peak = cum_returns.expanding(min_periods=1).max()
-    drawdown = (cum_returns/peak) - 1
-    max_drawdown = drawdown.min()
-    
-    # Win Rate
-    wins = data[data['Strategy Returns'] > 0]['Strategy Returns'].count()
-    losses = data[data['Strategy Returns'] < 0]['Strategy Returns'].count()
-    win_rate = wins / (wins + losses) if (wins + losses) > 0 else 0
-    
+from utils.market_data import market_data
+from utils.metrics import span
+
+TRADING_DAYS = 252
+
+# Upper bound on bars x symbols x parameter sets per vectorized pass; larger
+# sweeps run in chunks of parameter sets so the (P, T, S) intermediates stay small
+MAX_PANEL_CELLS = 5_000_000
+
+
+def _rolling_mean(close, window):
+    """NaN-aware rolling mean along the time axis of a (T, S) array; NaN until `window` valid bars."""
+    valid = ~np.isnan(close)
+    sums = np.cumsum(np.where(valid, close, 0.0), axis=0)
+    counts = np.cumsum(valid, axis=0)
+    sums = np.vstack([np.zeros((1, close.shape[1])), sums])
+    counts = np.vstack([np.zeros((1, close.shape[1])), counts])
+    out = np.full(close.shape, np.nan)
+    if window <= close.shape[0]:
+        window_sums = sums[window:] - sums[:-window]
+        window_counts = counts[window:] - counts[:-window]
+        out[window - 1:] = np.where(window_counts == window, window_sums / window, np.nan)
+    return out
+
+
+def _ema(close, window):
+    alpha = 2.0 / (window + 1)
+    out = np.full(close.shape, np.nan)
+    prev = np.full(close.shape[1], np.nan)
+    for t in range(close.shape[0]):
+        prev = np.where(np.isnan(prev), close[t], alpha * close[t] + (1 - alpha) * prev)
+        out[t] = prev
+    return out
+
+
+def sma_crossover(close, params):
+    """Long while SMA(fast) > SMA(slow). Returns positions shaped (P, T, S)."""
+    smas = {w: _rolling_mean(close, w) for w in {w for pair in params for w in pair}}
+    return np.stack([(smas[fast] > smas[slow]).astype(float) for fast, slow in params])
+
+
+def ema_crossover(close, params):
+    """Long while EMA(fast) > EMA(slow). Returns positions shaped (P, T, S)."""
+    emas = {w: _ema(close, w) for w in {w for pair in params for w in pair}}
+    return np.stack([(emas[fast] > emas[slow]).astype(float) for fast, slow in params])
+
+
+# Strategy name -> fn(close (T, S), params list) -> positions (P, T, S)
+STRATEGIES = {
+    "sma_crossover": sma_crossover,
+    "ema_crossover": ema_crossover,
+}
+
+DEFAULT_WINDOWS = [(20, 50)]
+
+
+def register_strategy(name, fn):
+    STRATEGIES[name] = fn
+
+
+def _panel(frames):
+    """
+    Stacks per-symbol closes into a (T, S) array aligned on each symbol's most
+    recent bar; shorter histories are NaN-padded at the front so every symbol
+    keeps its own trading calendar.
+    """
+    length = max(len(f) for f in frames)
+    close = np.full((length, len(frames)), np.nan)
+    for j, frame in enumerate(frames):
+        values = frame['Close'].to_numpy(dtype=float).reshape(-1)
+        close[length - len(values):, j] = values
+    return close
+
+
+def backtest_panel(close, positions, lengths):
+    """
+    Computes curves and metrics for every (param, symbol) pair in one pass.
+    `close` is (T, S), `positions` is (P, T, S), `lengths` the bar count per symbol.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        market_returns = np.full(close.shape, np.nan)
+        market_returns[1:] = close[1:] / close[:-1] - 1
+
+        # Trade on yesterday's signal
+        held = np.full(positions.shape, np.nan)
+        held[:, 1:] = positions[:, :-1]
+        strategy_returns = market_returns[None] * held
+
+        cumulative_market = np.nancumprod(1 + market_returns, axis=0) - 1
+        growth = np.nancumprod(1 + strategy_returns, axis=1)
+        cumulative_strategy = growth - 1
+
+        # Performance Metrics
+        total_return = cumulative_strategy[:, -1]
+        annual_return = (1 + total_return) ** (TRADING_DAYS / lengths[None]) - 1
+        annual_vol = np.nanstd(strategy_returns, axis=1, ddof=1) * np.sqrt(TRADING_DAYS)
+        sharpe_ratio = np.where(annual_vol != 0, annual_return / annual_vol, 0.0)
+
+        # Max Drawdown, measured from the first traded bar
+        growth = np.where(np.isnan(strategy_returns), np.nan, growth)
+        peak = np.fmax.accumulate(growth, axis=1)
+        max_drawdown = np.nanmin(growth / peak - 1, axis=1)
+
+        # Win Rate
+        wins = (strategy_returns > 0).sum(axis=1)
+        losses = (strategy_returns < 0).sum(axis=1)
+        win_rate = np.where(wins + losses > 0, wins / np.maximum(wins + losses, 1), 0.0)
+
     return {
-        "symbol": symbol,
-        "total_return": float(total_return * 100),
-        "annual_return": float(annual_return * 100),
-        "sharpe_ratio": float(sharpe_ratio),
-        "max_drawdown": float(max_drawdown * 100),
-        "win_rate": float(win_rate * 100),
-        "history": {
-            "dates": data.index.strftime('%Y-%m-%d').tolist(),
-            "market_returns": (cumulative_market_returns * 100).fillna(0).tolist(),
-            "strategy_returns": (cumulative_strategy_returns * 100).fillna(0).tolist()
-        }
+        "total_return": total_return,
+        "annual_return": annual_return,
+        "sharpe_ratio": np.nan_to_num(sharpe_ratio),
+        "max_drawdown": np.nan_to_num(max_drawdown),
+        "win_rate": win_rate,
+        "market_curve": cumulative_market,
+        "strategy_curve": cumulative_strategy,
     }
+
+
+def run_backtest_grid(symbols, windows=None, strategy='sma_crossover', include_history=False, period=365):
+    """
+    Backtests every symbol against every parameter set in vectorized passes
+    (one unless the sweep exceeds MAX_PANEL_CELLS). Returns {symbol: [result, ...]} with one result per entry of `windows`, each
+    shaped like `run_backtest` output plus its "params".
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy}")
+    windows = [tuple(w) for w in (windows or DEFAULT_WINDOWS)]
+
+    # One multi-ticker download for everything stale or cold, instead of one per symbol
+    market_data.prefetch(symbols, period=period)
+    frames = {}
+    for symbol in symbols:
+        data = market_data.get_history(symbol, period=period)
+        if not data.empty:
+            frames[symbol] = data
+    if not frames:
+        return {}
+
+    names = list(frames)
+    results = {symbol: [] for symbol in names}
+    with span("backtest"):
+        close = _panel([frames[s] for s in names])
+        lengths = np.array([len(frames[s]) for s in names], dtype=float)
+        chunk = max(1, MAX_PANEL_CELLS // close.size)
+        for start in range(0, len(windows), chunk):
+            params = windows[start:start + chunk]
+            metrics = backtest_panel(close, STRATEGIES[strategy](close, params), lengths)
+            for j, symbol in enumerate(names):
+                results[symbol].extend(_results(symbol, frames[symbol], strategy, params, metrics, j, include_history))
+    return results
+
+
+def _results(symbol, frame, strategy, windows, metrics, j, include_history):
+    """Per-parameter results for column `j` of one `backtest_panel` pass."""
+    n = len(frame)
+    results = []
+    for p, params in enumerate(windows):
+        result = {
+            "symbol": symbol,
+            "params": {"strategy": strategy, "fast": params[0], "slow": params[1]},
+            "total_return": float(metrics["total_return"][p, j] * 100),
+            "annual_return": float(metrics["annual_return"][p, j] * 100),
+            "sharpe_ratio": float(metrics["sharpe_ratio"][p, j]),
+            "max_drawdown": float(metrics["max_drawdown"][p, j] * 100),
+            "win_rate": float(metrics["win_rate"][p, j] * 100),
+        }
+        if include_history:
+            result["history"] = {
+                "dates": frame.index.strftime('%Y-%m-%d').tolist(),
+                "market_returns": (metrics["market_curve"][-n:, j] * 100).tolist(),
+                "strategy_returns": (metrics["strategy_curve"][p, -n:, j] * 100).tolist(),
+            }
+        results.append(result)
+    return results
+
+
+def run_backtests(symbols, strategy='sma_crossover'):
+    """`run_backtest` for many symbols in one vectorized pass; {symbol: result} for those with data."""
+    results = {}
+    for symbol, grid in run_backtest_grid(symbols, DEFAULT_WINDOWS, strategy=strategy, include_history=True).items():
+        result = grid[0]
+        result.pop("params")
+        # Latest indicators from the store's running state; sma_position is the position the curve ends in
+        result["indicators"] = market_data.indicators(symbol)
+        results[symbol] = result
+    return results
+
+
+def run_backtest(symbol, strategy='sma_crossover'):
+    # Simple Strategy: SMA 20/50 Crossover over 1 year of data from the shared store
+    return run_backtests([symbol], strategy).get(symbol)
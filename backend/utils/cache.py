@@ -0,0 +1,277 @@
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Freshness per category prefix, in hours ("forecast", "backtest", ...)
+CATEGORY_TTL_HOURS = {
+    "forecast": 1,
+    "analysis": 1,
+    "sentiment": 6,
+    "backtest": 24,
+}
+DEFAULT_TTL_HOURS = 12
+
+
+def ttl_for(category: str) -> float:
+    return CATEGORY_TTL_HOURS.get(category.split("_")[0], DEFAULT_TTL_HOURS)
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _sanitize_filename_part(part: str) -> str:
+    """Sanitizes a string to be used as part of a filename."""
+    return re.sub(r'[^\w.-]', '', part).strip()
+
+
+def dumps(data) -> bytes:
+    if HAS_ORJSON:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data).encode()
+
+
+def loads(raw: bytes):
+    if HAS_ORJSON:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+class AnalysisCache:
+    """
+    Two-tier cache for analysis results.
+
+    A size-bounded in-memory LRU sits in front of one JSON file per entry in
+    `cache_dir`. Disk writes go through a temp file and an atomic rename so
+    readers never see a half-written entry, and `evict()` prunes the directory
+    by age and total size. With `compress_level` set, files are gzipped; plain
+    files from before are still read.
+    """
+
+    def __init__(self, cache_dir="cache", max_memory_entries=256, max_memory_bytes=64 * 2**20,
+                 max_disk_bytes=256 * 2**20, max_disk_age_hours=72, compress_level=None):
+        self.cache_dir = cache_dir
+        self.compress_level = compress_level
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir_real_path = os.path.realpath(cache_dir)
+        self.max_memory_entries = max_memory_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_disk_age_hours = max_disk_age_hours
+
+        # key -> (data, saved_at, size_in_bytes)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "writes": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "errors": 0,
+        }
+
+    def safe_path(self, symbol: str, category: str) -> Optional[str]:
+        """
+        Constructs a safe cache file path and verifies it's within the cache dir.
+        Returns None if the path is unsafe.
+        """
+        sanitized_symbol = _sanitize_filename_part(symbol)
+        sanitized_category = _sanitize_filename_part(category)
+
+        if not sanitized_symbol or not sanitized_category:
+            logger.error(f"Sanitized symbol or category is empty: symbol='{symbol}', category='{category}'")
+            return None
+
+        filename = f"{sanitized_symbol}_{sanitized_category}.json"
+        prospective_path = os.path.join(self.cache_dir, filename)
+
+        # Resolve the real path to prevent directory traversal
+        resolved_path = os.path.realpath(prospective_path)
+
+        # Ensure the resolved path is actually inside our intended cache directory
+        if not resolved_path.startswith(self.cache_dir_real_path + os.sep):
+            logger.error(f"Attempted path traversal detected: {prospective_path} resolved to {resolved_path}")
+            return None
+
+        return prospective_path
+
+    def _remember(self, path, data, saved_at, size):
+        with self._lock:
+            if path in self._memory:
+                self._memory_bytes -= self._memory.pop(path)[2]
+            self._memory[path] = (data, saved_at, size)
+            self._memory_bytes += size
+            while self._memory and (len(self._memory) > self.max_memory_entries
+                                    or self._memory_bytes > self.max_memory_bytes):
+                _, (_, _, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+                self.counters["memory_evictions"] += 1
+
+    def _forget(self, path):
+        with self._lock:
+            if path in self._memory:
+                self._memory_bytes -= self._memory.pop(path)[2]
+
+    def load(self, symbol: str, category: str, hours: Optional[float] = None):
+        """
+        Returns (data, age_in_seconds) for an entry, or (None, None). Expired
+        entries are still returned; `hours` is only used to count them.
+        """
+        data, age = self._load(symbol, category, hours)
+        if data is not None and hours is not None and age >= hours * 3600:
+            self.counters["expired"] += 1
+        return data, age
+
+    def _load(self, symbol: str, category: str, hours: Optional[float] = None):
+        path = self.safe_path(symbol, category)
+        if not path:
+            return None, None
+
+        with self._lock:
+            entry = self._memory.get(path)
+        if entry is not None:
+            age = time.time() - entry[1]
+            # An expired memory copy may have been replaced on disk by another process
+            if hours is None or age < hours * 3600 or not self._newer_on_disk(path, entry[1]):
+                with self._lock:
+                    if path in self._memory:
+                        self._memory.move_to_end(path)
+                self.counters["memory_hits"] += 1
+                return entry[0], age
+
+        # A plain miss is not a read error, so it is handled outside the span
+        try:
+            saved_at = os.path.getmtime(path)
+        except FileNotFoundError:
+            self.counters["misses"] += 1
+            return None, None
+
+        try:
+            with span("cache_read"):
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                if raw[:2] == GZIP_MAGIC:
+                    raw = gzip.decompress(raw)
+                data = loads(raw)
+        except FileNotFoundError:
+            # Evicted between the two calls
+            self.counters["misses"] += 1
+            return None, None
+        except (ValueError, IOError) as e:
+            logger.error(f"Error reading cache file '{path}': {e}")
+            self.counters["errors"] += 1
+            self.counters["misses"] += 1
+            return None, None
+
+        self.counters["disk_hits"] += 1
+        self._remember(path, data, saved_at, len(raw))
+        return data, time.time() - saved_at
+
+    @staticmethod
+    def _newer_on_disk(path, saved_at):
+        try:
+            return os.path.getmtime(path) > saved_at
+        except OSError:
+            return False
+
+    def get(self, symbol: str, category: str, hours: Optional[float] = None):
+        """Returns the entry if it is younger than `hours` (default: category TTL)."""
+        hours = hours if hours is not None else ttl_for(category)
+        data, age = self.load(symbol, category, hours)
+        if data is None:
+            return None
+        if age < hours * 3600:
+            return data
+        logger.info(f"Cache for {symbol}_{category} expired.")
+        return None
+
+    def save(self, symbol: str, category: str, data: dict):
+        path = self.safe_path(symbol, category)
+        if not path:
+            logger.warning(f"Failed to get safe cache path for saving: symbol='{symbol}', category='{category}'")
+            return
+
+        tmp_path = None
+        try:
+            with span("cache_write"):
+                raw = dumps(data)
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+                os.fchmod(fd, 0o644)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(gzip.compress(raw, compresslevel=self.compress_level, mtime=0) if self.compress_level else raw)
+                os.replace(tmp_path, path)
+                tmp_path = None
+            self.counters["writes"] += 1
+            self._remember(path, data, time.time(), len(raw))
+        except (TypeError, ValueError, IOError) as e:
+            logger.error(f"Error writing cache file '{path}': {e}")
+            self.counters["errors"] += 1
+            self._forget(path)
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def evict(self):
+        """Removes disk entries older than the age limit, then oldest-first down to the size limit."""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            is_orphan_tmp = name.startswith(".tmp-") and now - st.st_mtime > 3600
+            if not name.endswith(".json") and not is_orphan_tmp:
+                continue
+            entries.append((st.st_mtime, st.st_size, path, is_orphan_tmp))
+
+        entries.sort()
+        total = sum(size for _, size, _, _ in entries)
+        removed = 0
+        for mtime, size, path, is_orphan_tmp in entries:
+            too_old = now - mtime > self.max_disk_age_hours * 3600
+            if not (is_orphan_tmp or too_old or total > self.max_disk_bytes):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._forget(path)
+            total -= size
+            removed += 1
+
+        self.counters["disk_evictions"] += removed
+        return removed
+
+    def stats(self):
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        fresh_hits = hits - self.counters["expired"]
+        return {
+            **self.counters,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "hit_ratio": fresh_hits / lookups if lookups else 0.0,
+            "serializer": "orjson" if HAS_ORJSON else "json",
+        }
@@ -0,0 +1,174 @@
+"""
+Incremental technical indicators over a symbol's daily closes.
+
+`IndicatorState` keeps running sums, EMAs, Wilder RSI averages and the
+running peak, so adding a bar (or revising the last one) costs O(1) instead
+of a pass over the whole history. `tick(price)` evaluates a provisional
+live price against the state without storing it.
+"""
+import math
+import threading
+from collections import deque
+
+SMA_WINDOWS = (20, 50)
+EMA_SPANS = (12, 26)
+RSI_PERIOD = 14
+BOLLINGER_WINDOW = 20
+BOLLINGER_K = 2
+
+
+def classify_regime(price, sma20, sma50):
+    """Trend regime from the price and its 20/50-day SMAs, as used by `StockPredictor.get_market_regime`."""
+    if sma20 is None or sma50 is None or any(math.isnan(v) for v in (price, sma20, sma50)):
+        return "Unknown"
+    if price > sma20 > sma50:
+        return "Trending Up"
+    if price < sma20 < sma50:
+        return "Trending Down"
+    if abs(sma20 - sma50) / (sma50 if sma50 != 0 else 1) < 0.02:
+        return "Sideways"
+    return "Volatile"
+
+
+class IndicatorState:
+    """
+    Running indicators for one symbol. Feed bars in date order with `update`;
+    a bar with the same date as the last one replaces it (a partial session
+    that was downloaded again).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        windows = set(SMA_WINDOWS) | {BOLLINGER_WINDOW}
+        # One extra close so the bar leaving each window is still at hand after a revision
+        self.closes = deque(maxlen=max(windows) + 1)
+        self.last_date = None
+        self._scalars = {
+            "bars": 0,
+            "sums": {w: 0.0 for w in windows},
+            "sumsq": 0.0,
+            "emas": {span: None for span in EMA_SPANS},
+            # Wilder averages; seeded with simple means over the first RSI_PERIOD changes
+            "avg_gain": 0.0,
+            "avg_loss": 0.0,
+            "peak": None,
+            "max_drawdown": 0.0,
+        }
+        self._before_last = None
+
+    @classmethod
+    def from_frame(cls, frame):
+        state = cls()
+        for date, close in zip(frame.index, frame['Close'].to_numpy(dtype=float).reshape(-1)):
+            state.update(date, close)
+        return state
+
+    @staticmethod
+    def _copy(scalars):
+        return {key: dict(value) if isinstance(value, dict) else value for key, value in scalars.items()}
+
+    @staticmethod
+    def _advance(scalars, closes, close):
+        """`scalars` after appending `close` to the bars in `closes` (which it does not modify)."""
+        s = IndicatorState._copy(scalars)
+        n = s["bars"]
+        for window in s["sums"]:
+            s["sums"][window] += close - (closes[-window] if len(closes) >= window else 0.0)
+        leaving = closes[-BOLLINGER_WINDOW] if len(closes) >= BOLLINGER_WINDOW else 0.0
+        s["sumsq"] += close * close - leaving * leaving
+
+        for span, ema in s["emas"].items():
+            alpha = 2.0 / (span + 1)
+            s["emas"][span] = close if ema is None else alpha * close + (1 - alpha) * ema
+
+        if n:
+            change = close - closes[-1]
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            if n <= RSI_PERIOD:
+                s["avg_gain"] += gain / RSI_PERIOD
+                s["avg_loss"] += loss / RSI_PERIOD
+            else:
+                s["avg_gain"] = (s["avg_gain"] * (RSI_PERIOD - 1) + gain) / RSI_PERIOD
+                s["avg_loss"] = (s["avg_loss"] * (RSI_PERIOD - 1) + loss) / RSI_PERIOD
+
+        s["peak"] = close if s["peak"] is None else max(s["peak"], close)
+        s["max_drawdown"] = min(s["max_drawdown"], close / s["peak"] - 1)
+        s["bars"] = n + 1
+        return s
+
+    def update(self, date, close):
+        close = float(close)
+        if math.isnan(close):
+            return
+        with self._lock:
+            if self.last_date is not None and date == self.last_date:
+                self._scalars = self._before_last
+                self.closes.pop()
+            elif self.last_date is not None and date < self.last_date:
+                raise ValueError(f"Bar {date} is older than the last one ({self.last_date})")
+            self._before_last = self._scalars
+            self._scalars = self._advance(self._scalars, self.closes, close)
+            self.closes.append(close)
+            self.last_date = date
+
+    def _snapshot(self, s, close, date, provisional):
+        bars = s["bars"]
+        sma = {w: s["sums"][w] / w if bars >= w else None for w in SMA_WINDOWS}
+        result = {
+            "date": date.strftime('%Y-%m-%d') if hasattr(date, "strftime") else date,
+            "close": close,
+            "bars": bars,
+            "provisional": provisional,
+            **{f"sma_{w}": v for w, v in sma.items()},
+            **{f"ema_{span}": ema for span, ema in s["emas"].items()},
+            "rsi_14": None,
+            "bollinger_upper": None,
+            "bollinger_middle": None,
+            "bollinger_lower": None,
+            "drawdown": close / s["peak"] - 1,
+            "max_drawdown": s["max_drawdown"],
+            "regime": classify_regime(close, sma[20], sma[50]) if bars >= 50 else "Unknown",
+            # Position of the default SMA 20/50 crossover strategy in utils/backtest.py
+            "sma_position": None if sma[50] is None else float(sma[20] > sma[50]),
+        }
+        if bars > RSI_PERIOD:
+            if s["avg_loss"] == 0:
+                result["rsi_14"] = 100.0 if s["avg_gain"] > 0 else 50.0
+            else:
+                result["rsi_14"] = 100 - 100 / (1 + s["avg_gain"] / s["avg_loss"])
+        if bars >= BOLLINGER_WINDOW:
+            n = BOLLINGER_WINDOW
+            mean = s["sums"][n] / n
+            # Sample standard deviation, as pandas' rolling().std()
+            std = math.sqrt(max(s["sumsq"] - n * mean * mean, 0.0) / (n - 1))
+            result.update(
+                bollinger_upper=mean + BOLLINGER_K * std,
+                bollinger_middle=mean,
+                bollinger_lower=mean - BOLLINGER_K * std,
+            )
+        return result
+
+    def snapshot(self):
+        """Indicators as of the last stored bar, or None before the first."""
+        with self._lock:
+            if self.last_date is None:
+                return None
+            return self._snapshot(self._scalars, self.closes[-1], self.last_date, False)
+
+    def tick(self, price, date=None):
+        """
+        Indicators with `price` as the close of the bar in progress: the last
+        bar's when `date` is omitted or not after it, otherwise a new bar's.
+        Nothing is stored.
+        """
+        price = float(price)
+        with self._lock:
+            if self.last_date is None:
+                return None
+            if date is None or date <= self.last_date:
+                closes = list(self.closes)[:-1]
+                scalars = self._advance(self._before_last, closes, price)
+                date = self.last_date
+            else:
+                scalars = self._advance(self._scalars, self.closes, price)
+            return self._snapshot(scalars, price, date, True)
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+def diff_states(previous, current):
+    """
+    Sections of `current` that differ from `previous`. "bars" only carries the
+    bars that are new or were revised; a changed "regime" is sent as
+    {"from", "to"}; "prediction" only the horizons whose summary changed.
+    """
+    if previous is None:
+        return dict(current)
+    delta = {}
+    for key, value in current.items():
+        before = previous.get(key)
+        if value == before:
+            continue
+        if key == "bars":
+            delta[key] = [bar for bar in value if bar not in (before or [])]
+        elif key == "regime":
+            delta[key] = {"from": before, "to": value}
+        elif key == "prediction":
+            delta[key] = {days: summary for days, summary in value.items() if (before or {}).get(days) != summary}
+        else:
+            delta[key] = value
+    return {key: value for key, value in delta.items() if value}
+
+
+class Subscriber:
+    """One client connection: the symbols and horizons it follows and a bounded queue of events."""
+
+    def __init__(self, days=(30,), max_queue=100):
+        self.symbols = set()
+        self.days = {str(d) for d in days}
+        self.queue = asyncio.Queue(maxsize=max_queue)
+
+    def _view(self, event):
+        if "prediction" not in event:
+            return event
+        prediction = {d: s for d, s in event["prediction"].items() if d in self.days}
+        event = {k: v for k, v in event.items() if k != "prediction"}
+        if prediction:
+            event["prediction"] = prediction
+        return event
+
+    def offer(self, kind, symbol, payload, latest):
+        event = self._view(payload)
+        if kind == "delta" and not event:
+            return
+        try:
+            self.queue.put_nowait({"event": kind, "symbol": symbol, **event})
+        except asyncio.QueueFull:
+            # A client this far behind gets a fresh snapshot instead of the deltas it missed
+            logger.warning("Live subscriber queue full; resyncing with snapshots.")
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            for s in self.symbols:
+                if s in latest:
+                    self.queue.put_nowait({"event": "snapshot", "symbol": s, **self._view(latest[s])})
+
+    async def events(self, heartbeat=None):
+        """Yields queued events; yields None after `heartbeat` idle seconds so transports can keep the connection alive."""
+        while True:
+            try:
+                yield await asyncio.wait_for(self.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+
+class LiveHub:
+    """
+    Fans live per-symbol updates out to subscribers.
+
+    Each symbol with at least one subscriber has a single producer task that
+    calls `produce(symbol, horizons)` every `interval` seconds, where
+    `horizons` are the prediction horizons its subscribers asked for. The
+    result is a dict of sections; only the sections that changed since the
+    previous call are published, as a "delta" event. New subscribers first get
+    a "snapshot" of the latest state. The producer stops when the last
+    subscriber for its symbol leaves.
+    """
+
+    def __init__(self, produce, interval=60):
+        self.produce = produce
+        self.interval = interval
+        self._subscribers = {}
+        self._horizons = {}
+        self._producers = {}
+        self._latest = {}
+
+    def subscribe(self, subscriber, symbols):
+        for symbol in symbols:
+            if symbol in subscriber.symbols:
+                continue
+            subscriber.symbols.add(symbol)
+            self._subscribers.setdefault(symbol, set()).add(subscriber)
+            horizons = self._horizons.setdefault(symbol, Counter())
+            new_horizon = bool(subscriber.days - set(horizons))
+            horizons.update(subscriber.days)
+            if symbol in self._latest:
+                subscriber.offer("snapshot", symbol, self._latest[symbol], self._latest)
+            if symbol not in self._producers:
+                self._producers[symbol] = asyncio.ensure_future(self._run(symbol))
+            elif new_horizon:
+                # Produce the missing horizon now rather than on the next tick
+                self._producers[symbol].cancel()
+                self._producers[symbol] = asyncio.ensure_future(self._run(symbol))
+
+    def unsubscribe(self, subscriber, symbols=None):
+        for symbol in list(subscriber.symbols if symbols is None else symbols):
+            if symbol not in subscriber.symbols:
+                continue
+            subscriber.symbols.discard(symbol)
+            followers = self._subscribers.get(symbol, set())
+            followers.discard(subscriber)
+            self._horizons[symbol].subtract(subscriber.days)
+            self._horizons[symbol] = +self._horizons[symbol]
+            if not followers:
+                self._subscribers.pop(symbol, None)
+                self._horizons.pop(symbol, None)
+                self._latest.pop(symbol, None)
+                task = self._producers.pop(symbol, None)
+                if task:
+                    task.cancel()
+
+    def _publish(self, kind, symbol, payload):
+        for subscriber in list(self._subscribers.get(symbol, ())):
+            subscriber.offer(kind, symbol, payload, self._latest)
+
+    async def _run(self, symbol):
+        while symbol in self._subscribers:
+            try:
+                state = await self.produce(symbol, sorted(self._horizons.get(symbol, ()), key=int))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Live update for {symbol} failed: {e}")
+                state = None
+            if state:
+                previous = self._latest.get(symbol)
+                # Sections that failed this round keep their last value
+                state = {**(previous or {}), **state}
+                self._latest[symbol] = state
+                if previous is None:
+                    self._publish("snapshot", symbol, state)
+                else:
+                    delta = diff_states(previous, state)
+                    if delta:
+                        self._publish("delta", symbol, delta)
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        return {
+            "symbols": len(self._producers),
+            "subscriptions": sum(len(s) for s in self._subscribers.values()),
+        }
+
+    def close(self):
+        for task in self._producers.values():
+            task.cancel()
+        self._producers.clear()
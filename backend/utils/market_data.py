@@ -0,0 +1,264 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+import yfinance as yf
+
+from utils.indicators import IndicatorState
+from utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# yfinance-style period strings mapped to calendar days
+PERIOD_DAYS = {
+    "1d": 1, "5d": 5, "1mo": 31, "3mo": 92, "6mo": 183,
+    "1y": 366, "2y": 731, "5y": 1827, "10y": 3653,
+}
+
+
+def period_to_days(period):
+    if isinstance(period, int):
+        return period
+    if period in PERIOD_DAYS:
+        return PERIOD_DAYS[period]
+    if period.endswith("d") and period[:-1].isdigit():
+        return int(period[:-1])
+    raise ValueError(f"Unsupported period: {period}")
+
+
+def days_to_period(days):
+    """Shortest yfinance period string covering `days` calendar days."""
+    for period, period_days in PERIOD_DAYS.items():
+        if period_days >= days:
+            return period
+    return "max"
+
+
+def normalize_download(data):
+    """Flattens a single-ticker yf.download frame to plain OHLCV columns."""
+    if data is None or data.empty:
+        return pd.DataFrame(columns=OHLCV_COLUMNS)
+    if isinstance(data.columns, pd.MultiIndex):
+        # Flatten MultiIndex columns (yfinance 0.2.0+ often returns them)
+        data.columns = data.columns.get_level_values(0)
+    data = data[[c for c in OHLCV_COLUMNS if c in data.columns]].copy()
+    if data.index.tz is not None:
+        data.index = data.index.tz_localize(None)
+    data.index.name = 'Date'
+    return data[~data.index.duplicated(keep='last')].sort_index()
+
+
+class MarketDataStore:
+    """
+    In-process store of daily OHLCV history, one frame per symbol.
+
+    The first request for a symbol downloads `min_days` of history; later
+    requests only download bars newer than the last stored date, and only once
+    `refresh_seconds` has passed since the previous refresh. Any period is
+    served as a slice of the stored frame.
+
+    A download that fails or comes back empty (often a rate limit) is not
+    recorded as coverage or as a refresh; the symbol is tried again after
+    `retry_seconds` instead of being served stale or empty for `refresh_seconds`.
+
+    Each frame has an `IndicatorState` next to it that is advanced with the
+    new bars on every merge, so the latest indicators never need a pass over
+    the history.
+    """
+
+    def __init__(self, min_days=731, refresh_seconds=900, retry_seconds=60):
+        self.min_days = min_days
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+        self._frames = {}
+        self._coverage = {}
+        self._refreshed_at = {}
+        self._failed_at = {}
+        self._indicators = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, symbol):
+        with self._guard:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def _download(self, symbol, start, fallback=False):
+        try:
+            with span("fetch"):
+                data = yf.download(symbol, start=start.strftime('%Y-%m-%d'), progress=False)
+                if fallback and (data is None or data.empty):
+                    # Fallback for some symbols or periods
+                    period = days_to_period((datetime.now() - start).days)
+                    data = yf.download(symbol, period=period, progress=False)
+            return normalize_download(data)
+        except Exception as e:
+            logger.error(f"Error fetching data for {symbol}: {e}")
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+
+    def _merge(self, symbol, fresh):
+        current = self._frames.get(symbol)
+        if current is None or current.empty:
+            merged = fresh
+        elif fresh.empty:
+            merged = current
+        else:
+            merged = pd.concat([current, fresh])
+            # The last stored bar may have been a partial session; keep the newer copy
+            merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+        self._frames[symbol] = merged
+        self._update_indicators(symbol, merged, fresh)
+
+    def _update_indicators(self, symbol, merged, fresh):
+        state = self._indicators.get(symbol)
+        if state is None or state.last_date is None or (not fresh.empty and fresh.index[0] < state.last_date):
+            # New symbol or older bars filled in: one pass over the stored history
+            if not merged.empty:
+                self._indicators[symbol] = IndicatorState.from_frame(merged)
+            return
+        for date, row in fresh.loc[fresh.index >= state.last_date].iterrows():
+            state.update(date, row['Close'])
+
+    def _failed_recently(self, symbol):
+        return (time.time() - self._failed_at.get(symbol, 0)) < self.retry_seconds
+
+    def _is_stale(self, symbol):
+        return (time.time() - self._refreshed_at.get(symbol, 0)) >= self.refresh_seconds and not self._failed_recently(symbol)
+
+    def _record(self, symbol, fresh, coverage=None):
+        """Marks `symbol` as refreshed (and covered from `coverage`) if the download returned bars."""
+        if fresh.empty:
+            self._failed_at[symbol] = time.time()
+            return
+        self._failed_at.pop(symbol, None)
+        if coverage is not None:
+            self._coverage[symbol] = coverage
+        self._refreshed_at[symbol] = time.time()
+
+    def _ensure(self, symbol, days):
+        """Makes sure the stored frame covers `days` of history and is fresh."""
+        days = max(days, self.min_days)
+        with self._lock_for(symbol):
+            now = datetime.now()
+            wanted_start = now - timedelta(days=days)
+            covered_from = self._coverage.get(symbol)
+
+            if covered_from is None or wanted_start < covered_from:
+                # Cold symbol or a deeper lookback than we hold: full download
+                if not self._failed_recently(symbol):
+                    fresh = self._download(symbol, wanted_start, fallback=True)
+                    self._merge(symbol, fresh)
+                    self._record(symbol, fresh, coverage=wanted_start)
+            elif self._is_stale(symbol):
+                frame = self._frames.get(symbol)
+                if frame is None or frame.empty:
+                    start = covered_from
+                else:
+                    start = frame.index[-1].to_pydatetime()
+                fresh = self._download(symbol, start)
+                self._merge(symbol, fresh)
+                self._record(symbol, fresh)
+
+            return self._frames.get(symbol)
+
+    def prefetch(self, symbols, period="2y"):
+        """
+        Brings many symbols up to date with one multi-ticker download: cold
+        symbols get the full lookback, stale ones only bars since the oldest
+        of their last stored dates.
+        """
+        days = max(period_to_days(period), self.min_days)
+        wanted_start = datetime.now() - timedelta(days=days)
+        cold, stale = [], []
+        for symbol in dict.fromkeys(symbols):
+            covered_from = self._coverage.get(symbol)
+            frame = self._frames.get(symbol)
+            if covered_from is None or wanted_start < covered_from or frame is None or frame.empty:
+                if not self._failed_recently(symbol):
+                    cold.append(symbol)
+            elif self._is_stale(symbol):
+                stale.append(symbol)
+
+        batches = []
+        if cold:
+            batches.append((cold, wanted_start, True))
+        if stale:
+            batches.append((stale, min(self._frames[s].index[-1] for s in stale).to_pydatetime(), False))
+
+        for batch, start, is_cold in batches:
+            try:
+                with span("fetch"):
+                    data = yf.download(batch, start=start.strftime('%Y-%m-%d'), group_by='ticker', progress=False)
+            except Exception as e:
+                logger.error(f"Error fetching data for {len(batch)} symbols: {e}")
+                data = pd.DataFrame()
+            tickers = set(data.columns.get_level_values(0)) if isinstance(data.columns, pd.MultiIndex) else set()
+            for symbol in batch:
+                if symbol in tickers:
+                    fresh = normalize_download(data[symbol].dropna(how='all'))
+                else:
+                    fresh = pd.DataFrame(columns=OHLCV_COLUMNS)
+                with self._lock_for(symbol):
+                    self._merge(symbol, fresh)
+                    self._record(symbol, fresh, coverage=start if is_cold else None)
+
+    def get_history(self, symbol, period="2y"):
+        """Returns a copy of the last `period` of daily bars for `symbol`."""
+        days = period_to_days(period)
+        frame = self._ensure(symbol, days)
+        if frame is None or frame.empty:
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+        start = pd.Timestamp(datetime.now() - timedelta(days=days)).normalize()
+        return frame.loc[frame.index >= start].copy()
+
+    def get_closes(self, symbols, period="2y"):
+        """
+        Closing prices of `symbols` as one frame over the union of their dates
+        (NaN where a symbol has no bar), without copying each symbol's history.
+        Symbols without bars in `period` are left out.
+        """
+        days = period_to_days(period)
+        start = pd.Timestamp(datetime.now() - timedelta(days=days)).normalize()
+        closes = {}
+        for symbol in dict.fromkeys(symbols):
+            frame = self._ensure(symbol, days)
+            if frame is not None and not frame.empty:
+                close = frame['Close'].loc[start:]
+                if not close.empty:
+                    closes[symbol] = close
+        return pd.concat(closes, axis=1).sort_index() if closes else pd.DataFrame()
+
+    def indicators(self, symbol):
+        """Latest indicators for `symbol` from the stored bars (no download), or None."""
+        state = self._indicators.get(symbol)
+        return state.snapshot() if state else None
+
+    def tick(self, symbol, price, date=None):
+        """
+        Indicators with a live `price` for the session of `date` (default: today
+        on weekdays, else the last stored bar), without storing it.
+        """
+        state = self._indicators.get(symbol)
+        if state is None:
+            return None
+        if date is None:
+            today = pd.Timestamp.now().normalize()
+            date = today if today.dayofweek < 5 else None
+        return state.tick(price, date)
+
+    def invalidate(self, symbol=None):
+        with self._guard:
+            targets = [symbol] if symbol else list(self._frames)
+            for s in targets:
+                self._frames.pop(s, None)
+                self._coverage.pop(s, None)
+                self._refreshed_at.pop(s, None)
+                self._failed_at.pop(s, None)
+                self._indicators.pop(s, None)
+
+
+# Shared by the predictor, the backtester and the API handlers
+market_data = MarketDataStore()
@@ -0,0 +1,121 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Seconds; spans range from sub-millisecond cache reads to multi-second fits
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Per-request list of (stage, seconds), read by the Server-Timing middleware
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.setdefault(labels, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                label_text = _labels(labels)
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{_braced(labels)} {series['sum']}")
+                lines.append(f"{self.name}_count{_braced(labels)} {series['count']}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_braced(labels)} {value}")
+        return lines
+
+
+def _labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+def _braced(labels):
+    return f"{{{_labels(labels)}}}" if labels else ""
+
+
+def sample_lines(name, help_text, samples, kind="gauge"):
+    """Renders values kept elsewhere (e.g. cache stats); `samples` is [(labels, value), ...]."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_braced(labels)} {value}" for labels, value in samples)
+    return lines
+
+
+stage_duration = Histogram("stockz_stage_duration_seconds", "Time spent in each analysis pipeline stage.")
+stage_errors = Counter("stockz_stage_errors_total", "Errors raised or swallowed in each analysis pipeline stage.")
+
+
+@contextmanager
+def span(stage):
+    """Times a pipeline stage into the histogram and the current request's Server-Timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc((("stage", stage),))
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.observe((("stage", stage),), elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def record_error(stage):
+    stage_errors.inc((("stage", stage),))
+
+
+def start_request_timing():
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings, total=None):
+    totals = defaultdict(float)
+    for stage, elapsed in timings:
+        totals[stage] += elapsed
+    parts = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in totals.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def render(extra_lines=()):
+    lines = stage_duration.render() + stage_errors.render() + list(extra_lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,137 @@
+import datetime
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import record_error, span
+
+logger = logging.getLogger(__name__)
+
+FINNHUB_BASE_URL = os.getenv("FINNHUB_BASE_URL", "https://finnhub.io/api/v1")
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class NewsFetchError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FinnhubNewsClient:
+    """
+    Shared Finnhub company-news client.
+
+    Requests reuse keep-alive connections from one pooled session, are paced by
+    a token bucket sized to the Finnhub quota, time out, and are retried with
+    jittered exponential backoff on 429/5xx. News is kept per symbol so later
+    calls only ask Finnhub for days since the previous fetch.
+    """
+
+    def __init__(self, api_key=None, base_url=FINNHUB_BASE_URL, calls_per_minute=None,
+                 timeout=10, max_retries=3, backoff=0.5, refresh_seconds=None, pool_size=10):
+        self.api_key = api_key if api_key is not None else os.getenv("NEXT_PUBLIC_FINNHUB_API_KEY")
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else int(os.getenv("NEWS_REFRESH_SECONDS", "300"))
+
+        calls_per_minute = calls_per_minute or int(os.getenv("FINNHUB_CALLS_PER_MINUTE", "60"))
+        self.bucket = TokenBucket(rate=calls_per_minute / 60.0, capacity=max(1, calls_per_minute // 6))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # symbol -> {"fetched_at": epoch, "fetched_day": date, "items": {id: item}}
+        self._news = {}
+        self._lock = threading.Lock()
+
+    def _get(self, path, params):
+        params = {**params, "token": self.api_key}
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                with span("news_fetch"):
+                    response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # Already counted as a news_fetch error by the span
+                if attempt == self.max_retries:
+                    raise NewsFetchError(f"Request failed: {e}")
+                delay = self.backoff * (2 ** attempt)
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                # A bad status never reaches the span as an exception
+                record_error("news_fetch")
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise NewsFetchError(f"Finnhub returned {response.status_code}", response.status_code)
+                retry_after = response.headers.get("Retry-After")
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * (2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            logger.info(f"Retrying Finnhub {path} (attempt {attempt + 2})")
+
+    def company_news(self, symbol, days=7):
+        """Returns news items for the last `days` days, newest first."""
+        today = datetime.date.today()
+        window_start = today - datetime.timedelta(days=days)
+
+        with self._lock:
+            entry = self._news.get(symbol)
+            if entry and time.time() - entry["fetched_at"] < self.refresh_seconds:
+                return self._window(entry, window_start)
+            # Finnhub filters by day, so re-ask for the last fetched day to catch late items
+            start = max(window_start, entry["fetched_day"]) if entry else window_start
+
+        fresh = self._get("/company-news", {
+            "symbol": symbol,
+            "from": start.strftime('%Y-%m-%d'),
+            "to": today.strftime('%Y-%m-%d'),
+        }) or []
+
+        with self._lock:
+            entry = self._news.setdefault(symbol, {"items": {}})
+            for item in fresh:
+                entry["items"][item.get("id") or item.get("headline")] = item
+            entry["fetched_at"] = time.time()
+            entry["fetched_day"] = today
+            return self._window(entry, window_start)
+
+    @staticmethod
+    def _window(entry, window_start):
+        cutoff = datetime.datetime.combine(window_start, datetime.time()).timestamp()
+        # Drop items that have slid out of the window so the per-symbol store stays bounded
+        entry["items"] = {k: v for k, v in entry["items"].items() if v.get("datetime", cutoff) >= cutoff}
+        return sorted(entry["items"].values(), key=lambda item: item.get("datetime", 0), reverse=True)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,172 @@
+from statistics import NormalDist
+
+import numpy as np
+
+from utils.backtest import TRADING_DAYS
+from utils.market_data import market_data, period_to_days
+from utils.metrics import span
+
+# Pairs with fewer overlapping daily returns get no covariance/correlation
+MIN_OVERLAP = 20
+
+
+def pairwise_moments(returns):
+    """
+    Covariance and correlation of the columns of a (T, N) returns array, each
+    pair over the rows where both are present, as a few matrix products
+    instead of a loop over pairs. Also returns the overlap counts and
+    var[i, j], the variance of column i over the rows shared with column j.
+    """
+    present = ~np.isnan(returns)
+    x = np.where(present, returns, 0.0)
+    m = present.astype(float)
+    n = m.T @ m
+    # sums[i, j]: sum of column i over rows where j is present too
+    sums = x.T @ m
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = (x.T @ x - sums * sums.T / n) / (n - 1)
+        var = ((x * x).T @ m - sums ** 2 / n) / (n - 1)
+        corr = cov / np.sqrt(var * var.T)
+    too_short = n < MIN_OVERLAP
+    cov[too_short] = np.nan
+    corr[too_short] = np.nan
+    return cov, corr, var, n
+
+
+def _value(x, scale=1.0):
+    x = float(x)
+    return None if np.isnan(x) else x * scale
+
+
+def _matrix(a):
+    rows = np.round(a, 6).tolist()
+    for i, j in zip(*np.nonzero(np.isnan(a))):
+        rows[i][j] = None
+    return rows
+
+
+def portfolio_analytics(symbols, weights=None, benchmark="SPY", period="1y", confidence=0.95, include_matrices=True):
+    """
+    Risk analytics for holdings `symbols` with `weights` (normalized to sum to
+    1; equal if omitted), in one vectorized pass over the aligned daily
+    returns matrix. Prices come from the shared store after one batched
+    refresh. Returns, volatility, VaR/CVaR and drawdowns are in percent;
+    covariance is annualized. Returns None when no holding has prices and
+    raises ValueError when the ones that do all have zero weight.
+    """
+    # Unknown periods raise ValueError before any download
+    period_to_days(period)
+    weights = np.ones(len(symbols)) if weights is None else np.asarray(weights, dtype=float)
+    held = dict(zip(symbols, weights))
+
+    # One multi-ticker download for everything stale or cold, instead of one per symbol
+    market_data.prefetch(list(held) + [benchmark], period=period)
+    closes = market_data.get_closes(list(held) + [benchmark], period)
+    symbols = [s for s in held if s in closes.columns]
+    missing = [s for s in held if s not in symbols]
+    if not symbols:
+        return None
+    if sum(held[s] for s in symbols) <= 0:
+        raise ValueError("weights of the holdings with price history must have a positive sum")
+
+    with span("portfolio"):
+        columns = symbols + ([benchmark] if benchmark in closes.columns else [])
+        prices = closes[columns].to_numpy(dtype=float)
+        returns = prices[1:] / prices[:-1] - 1
+        n_held = len(symbols)
+        w = np.array([held[s] for s in symbols], dtype=float)
+        w = w / w.sum()
+
+        cov, corr, var, overlap = pairwise_moments(returns)
+
+        # Daily portfolio return, weights renormalized over the holdings priced that day
+        held_returns = returns[:, :n_held]
+        priced = ~np.isnan(held_returns)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            aligned = np.where(priced, held_returns, 0.0) @ w / (priced @ w)
+        daily = aligned[~np.isnan(aligned)]
+
+        growth = np.cumprod(1 + daily)
+        total_return = growth[-1] - 1 if len(daily) else np.nan
+        annual_return = (1 + total_return) ** (TRADING_DAYS / max(len(daily), 1)) - 1
+        daily_vol = np.std(daily, ddof=1) if len(daily) > 1 else np.nan
+        annual_vol = daily_vol * np.sqrt(TRADING_DAYS)
+        portfolio_drawdown = np.min(growth / np.maximum.accumulate(growth) - 1) if len(daily) else np.nan
+
+        # Historical VaR/CVaR of one day's return, and the normal-approximation VaR
+        tail = 1 - confidence
+        cutoff = np.quantile(daily, tail) if len(daily) else np.nan
+        cvar = -daily[daily <= cutoff].mean() if len(daily) else np.nan
+        parametric_var = -(daily.mean() + NormalDist().inv_cdf(tail) * daily_vol) if len(daily) > 1 else np.nan
+
+        # Betas against the last column (the benchmark), over each holding's overlap with it
+        if len(columns) > n_held:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                betas = cov[:n_held, -1] / var[-1, :n_held]
+                benchmark_returns = returns[:, -1]
+                rows = ~np.isnan(aligned) & ~np.isnan(benchmark_returns)
+                portfolio_beta = np.cov(aligned[rows], benchmark_returns[rows])[0, 1] / np.var(benchmark_returns[rows], ddof=1)
+        else:
+            betas = np.full(n_held, np.nan)
+            portfolio_beta = np.nan
+
+        # Share of portfolio variance each holding contributes (pairs without enough overlap count as 0)
+        held_cov = np.nan_to_num(cov[:n_held, :n_held])
+        marginal = held_cov @ w
+        risk_contribution = w * marginal / (w @ marginal) if w @ marginal > 0 else np.full(n_held, np.nan)
+
+        held_prices = prices[:, :n_held]
+        peaks = np.fmax.accumulate(held_prices, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            drawdowns = np.nanmin(held_prices / peaks - 1, axis=0)
+        # First and last priced bar of each holding
+        valid = ~np.isnan(held_prices)
+        columns_index = np.arange(n_held)
+        first = held_prices[valid.argmax(axis=0), columns_index]
+        last = held_prices[len(held_prices) - 1 - valid[::-1].argmax(axis=0), columns_index]
+        held_vol = np.sqrt(np.diag(cov)[:n_held] * TRADING_DAYS)
+
+        held_corr = corr[:n_held, :n_held]
+        off_diagonal = held_corr[~np.eye(n_held, dtype=bool)]
+        average_correlation = np.nanmean(off_diagonal) if np.any(~np.isnan(off_diagonal)) else np.nan
+
+    result = {
+        "symbols": symbols,
+        "weights": w.tolist(),
+        "missing": missing,
+        "benchmark": benchmark if len(columns) > n_held else None,
+        "period": period,
+        "start": closes.index[0].strftime('%Y-%m-%d'),
+        "end": closes.index[-1].strftime('%Y-%m-%d'),
+        "observations": int(len(daily)),
+        "portfolio": {
+            "total_return": _value(total_return, 100),
+            "annual_return": _value(annual_return, 100),
+            "annual_volatility": _value(annual_vol, 100),
+            "sharpe_ratio": _value(annual_return / annual_vol) if annual_vol else None,
+            "beta": _value(portfolio_beta),
+            "max_drawdown": _value(portfolio_drawdown, 100),
+            "confidence": confidence,
+            "var_1d": _value(-cutoff, 100),
+            "cvar_1d": _value(cvar, 100),
+            "parametric_var_1d": _value(parametric_var, 100),
+            "average_correlation": _value(average_correlation),
+        },
+        "holdings": [
+            {
+                "symbol": symbol,
+                "weight": float(w[i]),
+                "total_return": _value(last[i] / first[i] - 1, 100),
+                "annual_volatility": _value(held_vol[i], 100),
+                "beta": _value(betas[i]),
+                "max_drawdown": _value(drawdowns[i], 100),
+                "risk_contribution": _value(risk_contribution[i]),
+                "observations": int(overlap[i, i]),
+            }
+            for i, symbol in enumerate(symbols)
+        ],
+    }
+    if include_matrices:
+        result["correlation"] = _matrix(held_corr)
+        result["covariance"] = _matrix(cov[:n_held, :n_held] * TRADING_DAYS)
+    return result
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves from several processes are not serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MARKET_TZ = ZoneInfo("America/New_York")
+
+
+def _parse_symbols(value):
+    return [s.strip() for s in (value or "").split(",") if s.strip()]
+
+
+class PopularityTracker:
+    """
+    Counts requests per symbol so refreshes can start with what users ask for
+    most. Counts are saved to `path` so a separate worker process can read them.
+    Each save adds the hits counted since the previous one to the counts
+    already in the file, so API workers sharing `path` add up instead of
+    overwriting each other.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.counts = Counter()
+        self._unsaved = Counter()
+
+    def hit(self, *symbols):
+        self.counts.update(symbols)
+        self._unsaved.update(symbols)
+
+    def top(self, n):
+        return [s for s, _ in self.counts.most_common(n)]
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return Counter(json.load(f))
+        except FileNotFoundError:
+            return Counter()
+
+    def save(self):
+        if not self.path:
+            return
+        unsaved, self._unsaved = self._unsaved, Counter()
+        try:
+            with self._locked():
+                try:
+                    counts = self._read()
+                except ValueError as e:
+                    logger.error(f"Discarding unreadable popularity counts: {e}")
+                    counts = Counter()
+                counts.update(unsaved)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", prefix=".tmp-")
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(dict(counts), f)
+                os.replace(tmp_path, self.path)
+            # Other workers' hits count here too from now on
+            self.counts = counts + self._unsaved
+        except OSError as e:
+            self._unsaved.update(unsaved)
+            logger.error(f"Could not save popularity counts: {e}")
+
+    def load(self):
+        if not self.path:
+            return
+        try:
+            self.counts = self._read() + self._unsaved
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load popularity counts: {e}")
+
+
+class PrecomputeScheduler:
+    """
+    Periodically refreshes cached analyses for a symbol universe.
+
+    The universe is the configured watchlist plus the most requested symbols,
+    ordered by popularity. `refresh(symbols, force)` does the actual work: an
+    interval tick refreshes entries about to expire, and a run shortly after
+    the US market close (weekdays) forces a refresh to pick up the new bar.
+    """
+
+    def __init__(self, refresh, popularity, symbols=None, interval_minutes=None, after_close=None, top_n=None,
+                 reload_popularity=False):
+        self.refresh = refresh
+        self.popularity = popularity
+        # A standalone worker does not see requests; it reads the counts the API saves
+        self.reload_popularity = reload_popularity
+        self.symbols = symbols if symbols is not None else _parse_symbols(os.getenv("PRECOMPUTE_SYMBOLS"))
+        self.interval = timedelta(minutes=interval_minutes or int(os.getenv("PRECOMPUTE_INTERVAL_MINUTES", "30")))
+        hour, minute = (after_close or os.getenv("PRECOMPUTE_AFTER_CLOSE", "16:30")).split(":")
+        self.after_close = time(int(hour), int(minute))
+        self.top_n = top_n if top_n is not None else int(os.getenv("PRECOMPUTE_TOP_N", "20"))
+        self._task = None
+
+    def universe(self):
+        configured = set(self.symbols)
+        ranked = self.popularity.top(self.top_n + len(configured))
+        ordered = [s for s in ranked if s in configured] + [s for s in ranked if s not in configured][:self.top_n]
+        # Configured symbols nobody has asked for yet still go in, last
+        return list(dict.fromkeys(ordered + self.symbols))
+
+    def _next_close_run(self, now):
+        run = datetime.combine(now.date(), self.after_close, tzinfo=MARKET_TZ)
+        while run <= now or run.weekday() >= 5:
+            run = datetime.combine(run.date() + timedelta(days=1), self.after_close, tzinfo=MARKET_TZ)
+        return run
+
+    async def run_once(self, force=False):
+        if self.reload_popularity:
+            self.popularity.load()
+        symbols = self.universe()
+        if not symbols:
+            return
+        started = datetime.now()
+        try:
+            await self.refresh(symbols, force)
+            logger.info(f"Precomputed {len(symbols)} symbols (force={force}) in {(datetime.now() - started).total_seconds():.1f}s")
+        except Exception as e:
+            logger.error(f"Precompute run failed: {e}")
+
+    async def run_forever(self):
+        next_close = self._next_close_run(datetime.now(MARKET_TZ))
+        # Warm the cache right away so the first requests after a restart hit it
+        await self.run_once()
+        while True:
+            now = datetime.now(MARKET_TZ)
+            next_tick = now + self.interval
+            if next_close <= next_tick:
+                await asyncio.sleep(max(0.0, (next_close - now).total_seconds()))
+                await self.run_once(force=True)
+                next_close = self._next_close_run(datetime.now(MARKET_TZ))
+            else:
+                await asyncio.sleep(self.interval.total_seconds())
+                await self.run_once()
+
+    def start(self):
+        self._task = asyncio.create_task(self.run_forever())
+        return self._task
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
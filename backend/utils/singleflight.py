@@ -0,0 +1,45 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key.
+
+    The first caller for a key starts the coroutine; everyone arriving while it
+    runs awaits the same task instead of repeating the work. The task is
+    shielded so a disconnecting client does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    def _start(self, key, fn, *args, background=False, **kwargs):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t, background))
+        return task
+
+    def _finish(self, key, task, background):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            if background:
+                # Nobody awaits a background refresh, so this log is the only trace of its failure
+                logger.error(f"Background refresh {key} failed: {task.exception()}")
+            else:
+                logger.debug(f"Single-flight call {key} failed: {task.exception()}")
+
+    async def do(self, key, fn, *args, **kwargs):
+        return await asyncio.shield(self._start(key, fn, *args, **kwargs))
+
+    def refresh(self, key, fn, *args, **kwargs):
+        """Starts (or joins) a call in the background without waiting for it."""
+        return self._start(key, fn, *args, background=True, **kwargs)
+
+    def in_flight(self):
+        return len(self._inflight)
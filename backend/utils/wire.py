@@ -0,0 +1,176 @@
+"""
+Compact wire format for the series in analysis responses.
+
+In compact mode every column of a series group (forecast, OHLCV history,
+backtest curves) is replaced by an encoded object; everything else in the
+payload stays plain JSON. Each object carries "enc", "n" (length) and base64
+little-endian "data":
+
+- "f32-xor": floats as float32, each value's bits XORed with the previous
+  value's (NaN for missing). Decode: uint32 running XOR, viewed as float32.
+- "i32-delta": integers (epoch timestamps) as int32 differences from the
+  previous value, the first from "start". Decode: start + cumulative sum.
+- "date-delta": "YYYY-MM-DD" strings as int32 day differences, as above.
+- "f64": raw float64, for integers whose differences do not fit int32.
+
+Neighbouring values share most of their high bits, so XOR/delta leaves long
+runs of zero bytes for gzip or brotli to remove. Series can also be
+downsampled with LTTB (largest triangle three buckets) before encoding, which
+keeps the visual shape of a chart with far fewer points.
+"""
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+import base64
+import gzip
+
+import numpy as np
+
+COMPACT_MEDIA_TYPE = "application/vnd.stockz.compact+json"
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+# Small bodies do not win enough to be worth the CPU
+MIN_COMPRESS_BYTES = 1024
+
+
+def _floats(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _is_numeric(values):
+    return all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values)
+
+
+def _mean(values):
+    values = [v for v in values if v == v]
+    return sum(values) / len(values) if values else None
+
+
+def lttb_indices(x, y, points):
+    """Indices of the `points` samples LTTB keeps from the series (x, y); first and last are always kept."""
+    n = len(y)
+    if points >= n or points < 3:
+        return list(range(n))
+    # Plain floats: per-bucket numpy calls cost more than they save on chart-sized series
+    x = [float("nan") if v is None else float(v) for v in x]
+    y = [float("nan") if v is None else float(v) for v in y]
+
+    every = (n - 2) / (points - 2)
+    keep = [0]
+    a = 0
+    for i in range(points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        # Average of the following bucket (just the last sample for the final bucket)
+        following = range(end, min(int((i + 2) * every) + 1, n)) if i < points - 3 else range(n - 1, n)
+        avg_x = _mean([x[j] for j in following])
+        avg_y = _mean([y[j] for j in following])
+        ax, ay = x[a], y[a]
+        best, best_area = start, -1.0
+        if avg_x is not None and avg_y is not None:
+            for j in range(start, end):
+                # Twice the area of the triangle (kept point, candidate, next bucket's average)
+                area = abs((ax - avg_x) * (y[j] - ay) - (ax - x[j]) * (avg_y - ay))
+                if area > best_area:
+                    best, best_area = j, area
+        keep.append(best)
+        a = best
+    keep.append(n - 1)
+    return keep
+
+
+def downsample_columns(columns, x_key, y_key, points):
+    """Keeps the LTTB-selected rows of every column, chosen by the shape of `y_key`."""
+    y = columns.get(y_key) or []
+    if not points or len(y) <= points:
+        return columns
+    x = columns.get(x_key) or []
+    if len(x) != len(y) or not _is_numeric(x):
+        x = range(len(y))
+    keep = lttb_indices(list(x), y, points)
+    return {
+        key: [values[i] for i in keep] if isinstance(values, list) and len(values) == len(y) else values
+        for key, values in columns.items()
+    }
+
+
+def _b64(array):
+    return base64.b64encode(array.tobytes()).decode("ascii")
+
+
+def encode_column(values):
+    n = len(values)
+    if n and all(isinstance(v, str) for v in values):
+        days = np.array(values, dtype="datetime64[D]").astype(np.int64)
+        return {"enc": "date-delta", "n": n, "start": values[0], "data": _b64(np.diff(days, prepend=days[0]).astype("<i4"))}
+
+    if n and all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        ints = np.array(values, dtype=np.int64)
+        deltas = np.diff(ints, prepend=ints[0])
+        if np.abs(deltas).max() < 2**31:
+            return {"enc": "i32-delta", "n": n, "start": values[0], "data": _b64(deltas.astype("<i4"))}
+        return {"enc": "f64", "n": n, "data": _b64(ints.astype("<f8"))}
+
+    bits = _floats(values).astype("<f4").view("<u4")
+    xored = bits ^ np.concatenate([np.zeros(1, dtype="<u4"), bits[:-1]])
+    return {"enc": "f32-xor", "n": n, "data": _b64(xored)}
+
+
+def decode_column(column):
+    """Inverse of `encode_column` (float32 precision for "f32-xor"); NaN comes back as None."""
+    raw = base64.b64decode(column["data"])
+    enc = column["enc"]
+    if enc == "f32-xor":
+        values = np.bitwise_xor.accumulate(np.frombuffer(raw, dtype="<u4")).view("<f4").astype(np.float64)
+        return [None if np.isnan(v) else float(v) for v in values]
+    if enc == "f64":
+        return np.frombuffer(raw, dtype="<f8").astype(np.int64).tolist()
+    deltas = np.frombuffer(raw, dtype="<i4").astype(np.int64)
+    if enc == "i32-delta":
+        return (column["start"] + np.cumsum(deltas)).tolist()
+    if enc == "date-delta":
+        start = np.datetime64(column["start"], "D")
+        return [str(d) for d in start + np.cumsum(deltas).astype("timedelta64[D]")]
+    raise ValueError(f"Unknown column encoding: {enc}")
+
+
+def reshape_series(payload, series, points=None, compact=False):
+    """
+    Returns a copy of `payload` with each series group downsampled to `points`
+    and/or encoded. `series` lists (path, x_key, y_key) where `path` leads to a
+    dict of parallel columns. Only dicts along those paths are copied, so a
+    cached payload passed in is never modified.
+    """
+    if not points and not compact:
+        return payload
+    result = dict(payload)
+    for path, x_key, y_key in series:
+        parent = result
+        for key in path[:-1]:
+            if not isinstance(parent.get(key), dict):
+                parent = None
+                break
+            parent[key] = dict(parent[key])
+            parent = parent[key]
+        if parent is None or not isinstance(parent.get(path[-1]), dict):
+            continue
+        columns = downsample_columns(parent[path[-1]], x_key, y_key, points)
+        if compact:
+            columns = {key: encode_column(values) if isinstance(values, list) else values for key, values in columns.items()}
+        parent[path[-1]] = columns
+    return result
+
+
+def compress(raw, accept_encoding):
+    """Returns (body, content_encoding or None), preferring brotli over gzip when the client accepts it."""
+    if len(raw) < MIN_COMPRESS_BYTES:
+        return raw, None
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if HAS_BROTLI and "br" in accepted:
+        return brotli.compress(raw, quality=BROTLI_QUALITY), "br"
+    if "gzip" in accepted:
+        return gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0), "gzip"
+    return raw, None
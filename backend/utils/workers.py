@@ -0,0 +1,127 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    """Raised when a stage already has as many queued calls as it accepts."""
+
+    def __init__(self, stage, retry_after):
+        super().__init__(f"Stage '{stage}' is saturated")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class Stage:
+    """Concurrency limit plus a bounded wait queue for one pipeline stage."""
+
+    def __init__(self, name, kind, limit, max_queue, retry_after=5):
+        self.name = name
+        self.kind = kind
+        self.limit = limit
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.pending = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @property
+    def running(self):
+        return self.limit - self._semaphore._value
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {name}; using {default}")
+        return default
+
+
+class WorkerPools:
+    """
+    Runs blocking work off the event loop.
+
+    CPU-bound stages (model fits) go to a process pool and I/O-bound stages
+    (downloads, news, inference that releases the GIL) to a thread pool. Each
+    stage has its own concurrency limit; once `limit + max_queue` calls are in
+    flight, further calls fail fast with PoolSaturated instead of piling up.
+    """
+
+    def __init__(self, cpu_workers=None, io_workers=None, start_method=None):
+        self.cpu_workers = cpu_workers or _env_int("CPU_WORKERS", max(1, (os.cpu_count() or 2) - 1))
+        self.io_workers = io_workers or _env_int("IO_WORKERS", 16)
+        self.start_method = start_method or os.getenv("CPU_POOL_START_METHOD")
+        self._cpu_pool = None
+        self._io_pool = None
+        self.stages = {}
+
+    def add_stage(self, name, kind="io", limit=None, max_queue=None, retry_after=5):
+        env_name = name.upper()
+        default_limit = self.cpu_workers if kind == "cpu" else self.io_workers
+        limit = limit or _env_int(f"{env_name}_CONCURRENCY", default_limit)
+        max_queue = max_queue if max_queue is not None else _env_int(f"{env_name}_MAX_QUEUE", limit * 4)
+        self.stages[name] = Stage(name, kind, limit, max_queue, retry_after)
+        return self.stages[name]
+
+    def _executor(self, kind):
+        if kind == "cpu":
+            if self._cpu_pool is None:
+                context = multiprocessing.get_context(self.start_method) if self.start_method else None
+                self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=context)
+            return self._cpu_pool
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="io")
+        return self._io_pool
+
+    async def run(self, stage_name, fn, *args, **kwargs):
+        stage = self.stages[stage_name]
+        if stage.pending >= stage.limit + stage.max_queue:
+            raise PoolSaturated(stage_name, stage.retry_after)
+
+        stage.pending += 1
+        try:
+            async with stage._semaphore:
+                loop = asyncio.get_running_loop()
+                call = functools.partial(fn, *args, **kwargs)
+                if stage.kind == "io":
+                    # Carry the request context into the thread (e.g. for Server-Timing spans)
+                    call = functools.partial(contextvars.copy_context().run, call)
+                return await loop.run_in_executor(self._executor(stage.kind), call)
+        finally:
+            stage.pending -= 1
+
+    async def run_queued(self, stage_name, fn, *args, **kwargs):
+        """Like `run`, but background work waits for room in the stage instead of failing with PoolSaturated."""
+        stage = self.stages[stage_name]
+        while stage.pending >= stage.limit + stage.max_queue:
+            await asyncio.sleep(stage.retry_after)
+        return await self.run(stage_name, fn, *args, **kwargs)
+
+    def stats(self):
+        return {
+            name: {"kind": s.kind, "running": s.running, "pending": s.pending, "limit": s.limit, "max_queue": s.max_queue}
+            for name, s in self.stages.items()
+        }
+
+    def shutdown(self, wait=True):
+        # Let in-flight work finish but drop anything still queued
+        for pool in (self._cpu_pool, self._io_pool):
+            if pool is not None:
+                pool.shutdown(wait=wait, cancel_futures=True)
+        self._cpu_pool = None
+        self._io_pool = None
+
+
+pools = WorkerPools()
+pools.add_stage("fetch", kind="io")
+pools.add_stage("fit", kind="cpu")
+pools.add_stage("sentiment", kind="io", limit=_env_int("SENTIMENT_CONCURRENCY", 2))
+pools.add_stage("backtest", kind="io", limit=_env_int("BACKTEST_CONCURRENCY", 4))
+# The numpy forecast models (models/ensemble.py) take milliseconds; threads keep the process pool for Prophet
+pools.add_stage("ensemble", kind="io", limit=_env_int("ENSEMBLE_CONCURRENCY", 4))